@@ -0,0 +1,176 @@
+"""
+Host-side benchmark for every panel in the waveshare_epd registry
+
+Runs each driver against the simulated epdconfig backend (epdsim) with the
+refresh and delays taken out, so the numbers are what the Pi spends encoding
+and pushing a frame:
+
+    getbuffer   image -> frame buffer (getbuffer_bicolor for 2 plane panels)
+    display     one full display() of that buffer
+    clear       one Clear()
+    4gray       getbuffer_4Gray + display_4Gray, on panels that have it
+
+For display and clear it also counts the commands, data transfers, bytes and
+GPIO writes that went to the panel and the time those bytes take on the bus.
+
+    python3 benchmarks/drivers.py                     # table for all panels
+    python3 benchmarks/drivers.py 2in9 4in2 7in5_V2   # just these
+    python3 benchmarks/drivers.py --json report.json  # machine-readable too
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import PIL
+from PIL import Image, ImageDraw
+
+import waveshare_epd
+from waveshare_epd import epdconfig, epdsim
+
+ROUNDS = 10
+
+
+def test_image(panel, mode):
+    """Something like a dashboard: text, boxes and a curve, in panel orientation."""
+    image = Image.new(mode, (panel.width, panel.height), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((2, 2, panel.width - 3, panel.height - 3), outline="black")
+    for y in range(8, panel.height - 12, 24):
+        draw.text((6, y), "{:4d} hPa {:5.1f} C".format(1000 + y, y / 10), fill="black")
+    xs = np.arange(panel.width)
+    ys = panel.height / 2 + np.sin(xs / 9.0) * panel.height / 4
+    draw.line(list(zip(xs.tolist(), ys.tolist())), fill="black", width=2)
+    if mode == "RGB":
+        draw.rectangle((panel.width // 2, 10, panel.width - 10, panel.height // 3), fill="red")
+    return image
+
+
+def init_panel(epd):
+    init = getattr(epd, "init", None) or epd.Init
+    if not inspect.signature(init).parameters:
+        return init()
+    # the SSD1608 style drivers take the LUT, epd2in13_V2 a mode flag
+    if hasattr(epd, "FULL_UPDATE"):
+        return init(epd.FULL_UPDATE)
+    return init(epd.lut_full_update)
+
+
+def clear_panel(epd):
+    if inspect.signature(epd.Clear).parameters:
+        return epd.Clear(0xFF)
+    return epd.Clear()
+
+
+def timed(function, rounds):
+    """Median wall time of function() in ms."""
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def traffic(sim, function, rounds):
+    """Median host ms of function() plus the bus traffic of a single call."""
+    ms = timed(function, rounds)
+    sim.reset_counters()
+    function()
+    return {
+        "host_ms": round(ms, 3),
+        "commands": sum(1 for dc, _ in sim.bus if not dc),
+        "data_transfers": sum(1 for dc, _ in sim.bus if dc),
+        "bytes": sim.commands + sim.data_bytes,
+        "gpio_writes": len(sim.gpio),
+        "wire_ms": round(sim.bus_seconds * 1000, 3),
+        "refreshes": sim.refreshes,
+    }
+
+
+def bench_panel(panel, rounds):
+    sim = epdconfig.use(epdsim.Simulated(panel.name, refresh_ms=0, speed=float("inf")))
+    epd = waveshare_epd.EPD(panel.name)
+    init_panel(epd)
+
+    result = {"width": panel.width, "height": panel.height, "planes": panel.planes}
+    if panel.planes == 2:
+        image = test_image(panel, "RGB")
+        result["getbuffer_ms"] = round(timed(lambda: epd.getbuffer_bicolor(image), rounds), 3)
+        planes = epd.getbuffer_bicolor(image)
+    else:
+        image = test_image(panel, "1")
+        result["getbuffer_ms"] = round(timed(lambda: epd.getbuffer(image), rounds), 3)
+        planes = (epd.getbuffer(image),)
+
+    show = getattr(epd, "display", None) or epd.Display
+
+    def display():
+        # the frame digest would skip every repeat after the first
+        epd.frame_digest.reset()
+        show(*planes)
+
+    result["display"] = traffic(sim, display, rounds)
+    result["clear"] = traffic(sim, lambda: clear_panel(epd), rounds)
+
+    if panel.gray:
+        gray_image = test_image(panel, "L")
+        result["getbuffer_4gray_ms"] = round(timed(lambda: epd.getbuffer_4Gray(gray_image), rounds), 3)
+        gray = epd.getbuffer_4Gray(gray_image)
+
+        def display_4gray():
+            epd.frame_digest.reset()
+            epd.display_4Gray(gray)
+
+        result["4gray"] = traffic(sim, display_4gray, rounds)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the e-Paper drivers off-device")
+    parser.add_argument("panels", nargs="*", help="panel names, default all")
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--json", help="also write the report to this file, - for stdout")
+    args = parser.parse_args()
+
+    names = args.panels or list(waveshare_epd.PANELS)
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "machine": platform.machine(),
+        "rounds": args.rounds,
+        "spi_hz": epdsim.SPI_HZ,
+        "panels": {},
+    }
+
+    out = sys.stderr if args.json == "-" else sys.stdout
+    print("{:10} {:>9} {:>12} {:>10} {:>8} {:>8} {:>7} {:>8} {:>10}".format(
+        "panel", "size", "getbuffer ms", "display ms", "bytes", "commands", "data", "gpio", "wire ms"), file=out)
+    for name in names:
+        panel = waveshare_epd.panel(name)
+        result = bench_panel(panel, args.rounds)
+        report["panels"][panel.name] = result
+        display = result["display"]
+        print("{:10} {:>9} {:12.3f} {:10.3f} {:8d} {:8d} {:7d} {:8d} {:10.1f}".format(
+            panel.name, "{}x{}".format(panel.width, panel.height), result["getbuffer_ms"],
+            display["host_ms"], display["bytes"], display["commands"], display["data_transfers"],
+            display["gpio_writes"], display["wire_ms"]), file=out)
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
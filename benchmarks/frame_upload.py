@@ -0,0 +1,114 @@
+"""
+Frame upload benchmark for the SSD1608 family (epd1in54, epd2in9, epd2in13)
+
+Compares the old row-by-row upload (SetCursor + WRITE_RAM per row) with the
+streamed WriteFrame() upload. Runs against a stand-in epdconfig that records
+the bus traffic, so it needs no panel attached; the refresh itself is not
+included.
+
+    python3 benchmarks/frame_upload.py
+"""
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SPI_HZ = 4000000
+PANELS = ["epd1in54", "epd2in9", "epd2in13"]
+ROUNDS = 20
+
+
+class RecordingConfig(types.ModuleType):
+    """Just enough of epdconfig to drive a panel, counting what goes over the bus"""
+    RST_PIN = 17
+    DC_PIN = 25
+    CS_PIN = 8
+    BUSY_PIN = 24
+
+    def __init__(self):
+        super().__init__("waveshare_epd.epdconfig")
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.transfers = 0
+        self.bytes = 0
+        self.busy_waits = 0
+
+    def digital_write(self, pin, value):
+        pass
+
+    def digital_read(self, pin):
+        return 0
+
+    def delay_ms(self, delaytime):
+        pass
+
+    def wait_busy(self, level, timeout=None):
+        self.busy_waits += 1
+
+    def spi_writebyte(self, data):
+        self.transfers += 1
+        self.bytes += len(data)
+
+    def spi_writebyte2(self, data):
+        self.transfers += 1
+        self.bytes += len(data)
+
+    def send_data_bulk(self, data):
+        self.spi_writebyte2(data)
+
+    def module_init(self):
+        return 0
+
+    def module_exit(self):
+        pass
+
+
+def upload_per_row(epd, frame):
+    linewidth = len(frame) // epd.height
+    for j in range(0, epd.height):
+        epd.SetCursor(0, j)
+        epd.send_command(0x24)
+        epd.send_data_bulk(frame[j * linewidth:(j + 1) * linewidth])
+
+
+def upload_streamed(epd, frame):
+    epd.WriteFrame(frame)
+
+
+def measure(config, epd, upload, frame):
+    config.reset_counters()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        upload(epd, frame)
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    return {
+        "host_ms": elapsed * 1000,
+        "transfers": config.transfers // ROUNDS,
+        "bytes": config.bytes // ROUNDS,
+        "busy_waits": config.busy_waits // ROUNDS,
+        "wire_ms": config.bytes // ROUNDS * 8 * 1000 / SPI_HZ,
+    }
+
+
+def main():
+    config = RecordingConfig()
+    sys.modules["waveshare_epd.epdconfig"] = config
+    import importlib
+
+    print("{:10} {:9} {:>9} {:>10} {:>7} {:>11} {:>8}".format(
+        "panel", "upload", "host ms", "transfers", "bytes", "busy waits", "wire ms"))
+    for name in PANELS:
+        module = importlib.import_module("waveshare_epd." + name)
+        epd = module.EPD()
+        frame = bytes([0xFF]) * (((epd.width + 7) // 8) * epd.height)
+        for label, upload in (("per-row", upload_per_row), ("streamed", upload_streamed)):
+            result = measure(config, epd, upload, frame)
+            print("{:10} {:9} {host_ms:9.3f} {transfers:10d} {bytes:7d} {busy_waits:11d} {wire_ms:8.1f}".format(
+                name, label, **result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Replay LoRa packets through the lora.py pipeline, off the Pi
+
+Feeds a packet stream into lora.loop() the way the radio would, through
+epaper_queue and influxdb_queue into the EPaper and InfluxDB sinks, with
+stand-ins for the hardware:
+
+    radio       ReplayRadio, hands out frames on their original schedule
+                divided by --speed, or back to back with --speed max
+    display     the simulated epdconfig backend (epdsim) for the 2.9" panel,
+                refreshing as slowly as the real one unless --refresh-ms
+    influxdb    FakeInfluxDB, whose write_points() takes --influx-ms
+
+The stream is a made-up flight (--count packets at --rate a second) or the
+frames of a capture file (see capture.py). The report has the throughput,
+the queue depths and percentiles of each stage's latency:
+
+    enqueue     radio interrupt -> packet on both queues (parse, crc, capture)
+    wait        time a packet sat in a sink's queue
+    service     time a sink spent on a packet before asking for the next
+    total       radio interrupt -> sink done with the packet
+
+The sink queues are SinkQueues sized and with the policies lora.py uses,
+unless --epaper-queue, --epaper-policy and so on say otherwise.
+
+A sink falls behind once packets arrive faster than 1 / its mean service
+time; the lowest of those is the receive rate the pipeline can sustain.
+
+    python3 benchmarks/pipeline.py                          # 2000 packets, max speed
+    python3 benchmarks/pipeline.py --rate 20 --speed 1      # real time at 20 packets/s
+    python3 benchmarks/pipeline.py --capture lora.capture --flight 3 --speed 10
+    python3 benchmarks/pipeline.py --influx-ms 500 --influxdb-policy drop-oldest
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+import lora
+from capture import Capture, CaptureWriter
+from packet import CRC_OFFSET, PACKET_STRUCT, SEALEVEL_PRESSURE, crc8
+from sinkqueue import POLICIES, SinkQueue
+from waveshare_epd import epdconfig, epdsim
+
+COUNT = 2000
+RATE = 10.0
+INFLUX_MS = 20.0
+PERCENTILES = (50, 90, 99, 100)
+
+
+def synthetic(count, rate, flight_number=1):
+    """(received, raw packet) of a made-up flight: a fast climb and a slow descent."""
+    times = np.arange(count) / rate
+    apogee = count // 5
+    heights = np.where(np.arange(count) < apogee, np.arange(count) * 3.0,
+                       np.maximum(0.0, apogee * 3.0 - (np.arange(count) - apogee) * 0.75))
+    temperatures = 20.0 - heights * 0.0065
+    # altitude() solved for pressure
+    pressures = SEALEVEL_PRESSURE / (1 + heights * 0.0065 / (temperatures + 273.15)) ** 5.257
+    frames = []
+    for packet_number, (received, pressure, temperature) in enumerate(zip(times, pressures, temperatures)):
+        raw_packet = bytearray(PACKET_STRUCT.pack(temperature, pressure, 3.7, packet_number, flight_number, 0))
+        raw_packet[CRC_OFFSET] = crc8(raw_packet[:CRC_OFFSET])
+        frames.append((float(received), bytes(raw_packet)))
+    return frames
+
+
+def recorded(path, flight_number=None):
+    """(received, raw packet) of every frame in a capture file, or of one flight."""
+    capture = Capture(path)
+    records = capture.records if flight_number is None else capture.flight(flight_number)
+    return list(zip((records["received"] / 1e9).tolist(), capture.raw_packets(records)))
+
+
+class ReplayRadio:
+    """Stands in for lora.Receiver; receive() blocks forever once the frames run out."""
+
+    def __init__(self, frames, speed):
+        self.frames = iter(frames)
+        self.speed = speed
+        self.first = None
+        self.start = None
+        self.sent = 0
+        self.finished = threading.Event()
+
+    def receive(self):
+        frame = next(self.frames, None)
+        if frame is None:
+            self.finished.set()
+            threading.Event().wait()
+        scheduled, raw_packet = frame
+        if self.first is None:
+            self.first, self.start = scheduled, time.perf_counter()
+        if self.speed != float("inf"):
+            delay = self.start + (scheduled - self.first) / self.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.sent += 1
+        return time.time_ns(), raw_packet
+
+
+class FakeInfluxDB:
+    """write_points() that takes latency seconds, like one HTTP request would."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+        self.points = 0
+
+    def write_points(self, points, time_precision=None):
+        time.sleep(self.latency)
+        self.requests += 1
+        self.points += len(points)
+
+
+class TimedQueue(SinkQueue):
+    """SinkQueue that times each packet through it, for a single consumer.
+
+    A packet's service time runs from the get() that returned it to the
+    consumer's next get() call. Dropped packets are only counted. Times are
+    taken in ns, like Packet.received, and kept in seconds.
+    """
+
+    def __init__(self, maxsize, policy):
+        super().__init__(maxsize, policy)
+        self.put_times = {}
+        self.current = None
+        self.enqueue = []
+        self.wait = []
+        self.service = []
+        self.total = []
+        self.depths = []
+        self.done = 0
+
+    def put(self, item, block=True, timeout=None):
+        self.enqueue.append((time.time_ns() - item.received) / 1e9)
+        super().put(item, block, timeout)
+        self.depths.append(self.qsize())
+
+    def _put(self, item):
+        self.put_times[id(item)] = time.time_ns()
+        super()._put(item)
+
+    def _get(self):
+        item = super()._get()
+        self.wait.append((time.time_ns() - self.put_times.pop(id(item))) / 1e9)
+        return item
+
+    def _drop(self):
+        # _get() above already took the packet's put time
+        item = super()._drop()
+        self.wait.pop()
+        return item
+
+    def get(self, block=True, timeout=None):
+        now = time.time_ns()
+        if self.current is not None:
+            item, got = self.current
+            self.service.append((now - got) / 1e9)
+            self.total.append((now - item.received) / 1e9)
+            self.done += 1
+            self.current = None
+        item = super().get(block, timeout)
+        self.current = item, time.time_ns()
+        return item
+
+    def settled(self):
+        """True once every packet put has been handled or dropped."""
+        return self.done + self.dropped >= len(self.enqueue)
+
+
+def percentiles(seconds):
+    values = np.percentile(np.asarray(seconds) * 1000, PERCENTILES) if seconds else [0.0] * len(PERCENTILES)
+    return {"p{}".format(p): round(float(v), 3) for p, v in zip(PERCENTILES, values)}
+
+
+def sink_report(name, timed_queue):
+    mean_service = float(np.mean(timed_queue.service)) if timed_queue.service else 0.0
+    return {
+        "sink": name,
+        "packets": timed_queue.done,
+        "dropped": timed_queue.dropped,
+        "policy": timed_queue.policy,
+        "maxsize": timed_queue.maxsize,
+        "max_depth": max(timed_queue.depths, default=0),
+        "mean_depth": round(float(np.mean(timed_queue.depths)), 1) if timed_queue.depths else 0.0,
+        "wait_ms": percentiles(timed_queue.wait),
+        "service_ms": percentiles(timed_queue.service),
+        "total_ms": percentiles(timed_queue.total),
+        "capacity_per_s": round(1 / mean_service, 1) if mean_service else float("inf"),
+    }
+
+
+def replay(frames, speed, influx_latency, refresh_ms, epaper_queue, influxdb_queue):
+    os.chdir(ROOT)  # EPaper loads its fonts from here
+    sim = epdconfig.use(epdsim.Simulated("2in9", refresh_ms=refresh_ms))
+    lora.epaper_queue = TimedQueue(*epaper_queue)
+    lora.influxdb_queue = TimedQueue(*influxdb_queue)
+    epaper = lora.EPaper(lora.epaper_queue)
+    influxdb = lora.InfluxDB(lora.influxdb_queue, client=FakeInfluxDB(influx_latency))
+    threading.Thread(target=epaper.loop, daemon=True).start()
+    threading.Thread(target=influxdb.loop, daemon=True).start()
+    sim.reset_counters()
+
+    radio = ReplayRadio(frames, speed)
+    with tempfile.TemporaryDirectory() as directory:
+        capture = CaptureWriter(os.path.join(directory, "replay.capture"))
+        start = time.perf_counter()
+        threading.Thread(target=lora.loop, args=(radio, capture), daemon=True).start()
+        radio.finished.wait()
+        received = time.perf_counter() - start
+        sinks = (lora.epaper_queue, lora.influxdb_queue)
+        while not all(sink.settled() for sink in sinks):
+            time.sleep(0.01)
+        # InfluxDB holds the tail of the stream back until its batch is due
+        while influxdb.written + influxdb.rejected < lora.influxdb_queue.done:
+            time.sleep(0.01)
+        epaper.worker.flush()
+        elapsed = time.perf_counter() - start
+        capture.close()
+
+    return {
+        "packets": radio.sent,
+        "receive_s": round(received, 3),
+        "elapsed_s": round(elapsed, 3),
+        "offered_per_s": round(radio.sent / received, 1) if received else float("inf"),
+        "throughput_per_s": round(radio.sent / elapsed, 1),
+        "enqueue_ms": percentiles(lora.epaper_queue.enqueue),
+        "sinks": [sink_report("epaper", lora.epaper_queue), sink_report("influxdb", lora.influxdb_queue)],
+        "frames_shown": epaper.worker.shown,
+        "full_refreshes": epaper.scheduler.full_refreshes,
+        "partial_refreshes": epaper.scheduler.partial_refreshes,
+        "influx_requests": influxdb.client.requests,
+        "influx_points": influxdb.client.points,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay packets through the lora.py pipeline off-device")
+    parser.add_argument("--capture", help="replay this capture file instead of a made-up flight")
+    parser.add_argument("--flight", type=int, help="only this flight of the capture")
+    parser.add_argument("--count", type=int, default=COUNT, help="packets in the made-up flight")
+    parser.add_argument("--rate", type=float, default=RATE, help="packets a second in the made-up flight")
+    parser.add_argument("--speed", default="max", help="replay speed, 1 for real time, max for no gaps")
+    parser.add_argument("--influx-ms", type=float, default=INFLUX_MS, help="time a write_points() takes")
+    parser.add_argument("--refresh-ms", type=float, help="panel refresh time, default the real 2.9\" one")
+    parser.add_argument("--epaper-queue", type=int, default=lora.EPAPER_QUEUE_SIZE, help="epaper_queue size")
+    parser.add_argument("--epaper-policy", choices=POLICIES, default=lora.EPAPER_QUEUE_POLICY)
+    parser.add_argument("--influxdb-queue", type=int, default=lora.INFLUXDB_QUEUE_SIZE, help="influxdb_queue size")
+    parser.add_argument("--influxdb-policy", choices=POLICIES, default=lora.INFLUXDB_QUEUE_POLICY)
+    parser.add_argument("--json", help="also write the report to this file, - for stdout")
+    args = parser.parse_args()
+    if args.json and args.json != "-":
+        args.json = os.path.abspath(args.json)
+
+    if args.capture:
+        frames = recorded(os.path.abspath(args.capture), args.flight)
+    else:
+        frames = synthetic(args.count, args.rate)
+    speed = float("inf") if args.speed == "max" else float(args.speed)
+
+    # lora.loop() prints a ! per packet
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        report = replay(frames, speed, args.influx_ms / 1000.0, args.refresh_ms,
+                        (args.epaper_queue, args.epaper_policy), (args.influxdb_queue, args.influxdb_policy))
+    report.update({
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "speed": args.speed,
+        "influx_ms": args.influx_ms,
+    })
+
+    out = sys.stderr if args.json == "-" else sys.stdout
+    print("{} packets in {:.2f} s: offered {:.1f}/s, handled {:.1f}/s".format(
+        report["packets"], report["elapsed_s"], report["offered_per_s"], report["throughput_per_s"]), file=out)
+    print("enqueue ms  " + "  ".join("{} {:.3f}".format(k, v) for k, v in report["enqueue_ms"].items()), file=out)
+    print("{:9} {:>7} {:>7} {:>9} {:>10} {:>10} {:>11} {:>10} {:>10}".format(
+        "sink", "packets", "dropped", "max depth", "wait p99", "service p50", "service p99", "total p99",
+        "capacity/s"), file=out)
+    for sink in report["sinks"]:
+        print("{:9} {:7d} {:7d} {:9d} {:10.1f} {:11.3f} {:11.3f} {:10.1f} {:10.1f}".format(
+            sink["sink"], sink["packets"], sink["dropped"], sink["max_depth"], sink["wait_ms"]["p99"], sink["service_ms"]["p50"],
+            sink["service_ms"]["p99"], sink["total_ms"]["p99"], sink["capacity_per_s"]), file=out)
+    print("display: {} frames, {} full and {} partial refreshes".format(
+        report["frames_shown"], report["full_refreshes"], report["partial_refreshes"]), file=out)
+    print("influxdb: {} points in {} requests".format(report["influx_points"], report["influx_requests"]), file=out)
+    print("falls behind above {:.1f} packets/s".format(min(sink["capacity_per_s"] for sink in report["sinks"])), file=out)
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
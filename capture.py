@@ -0,0 +1,197 @@
+"""
+Append-only capture of everything the LoRa radio receives
+
+Every frame rfm9x.receive() hands over is kept, valid or not, as one fixed
+size record: the raw bytes (padded or cut to PACKET_SIZE), how many bytes
+there really were, when it was received (ns since the epoch) and whether
+its crc matched.
+The packet fields overlap the raw bytes in CAPTURE_DTYPE, so a Capture reads
+temperatures, pressures and so on straight out of the memory-mapped file.
+
+A sidecar index (path + ".idx") has one entry per run of records from the
+same flight, so a flight's records are found without scanning the file. Only
+records with a good crc start a run; a corrupt flight_number stays in the
+run it arrived in.
+
+    capture = Capture("lora.capture")
+    capture.flights()                   # {flight_number: number of records}
+    capture.flight(3)["pressure"]       # pressures of flight 3
+"""
+import os
+
+import numpy as np
+
+from packet import PACKET_DTYPE, PACKET_SIZE
+
+
+MAGIC = b"BSTNCAP1"
+
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("record_size", "<u4"), ("reserved", "<u4")])
+HEADER_SIZE = HEADER_DTYPE.itemsize
+
+CAPTURE_DTYPE = np.dtype({
+    "names": ["raw"] + list(PACKET_DTYPE.names) + ["received", "length", "valid"],
+    "formats": ["V{}".format(PACKET_SIZE)]
+    + [PACKET_DTYPE.fields[name][0] for name in PACKET_DTYPE.names]
+    + ["<i8", "u1", "?"],
+    "offsets": [0]
+    + [PACKET_DTYPE.fields[name][1] for name in PACKET_DTYPE.names]
+    + [PACKET_SIZE, PACKET_SIZE + 8, PACKET_SIZE + 9],
+    "itemsize": PACKET_SIZE + 16,
+})
+
+# one entry per run of records from the same flight
+INDEX_DTYPE = np.dtype([("flight_number", "<u4"), ("reserved", "<u4"), ("start", "<u8")])
+
+
+def _header():
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["record_size"] = CAPTURE_DTYPE.itemsize
+    return header.tobytes()
+
+
+def _check_header(path, header):
+    header = np.frombuffer(header, dtype=HEADER_DTYPE)
+    if len(header) != 1 or header["magic"][0] != MAGIC:
+        raise ValueError("{} is not a capture file".format(path))
+    if header["record_size"][0] != CAPTURE_DTYPE.itemsize:
+        raise ValueError("{} has {} byte records, expected {}".format(
+            path, header["record_size"][0], CAPTURE_DTYPE.itemsize))
+
+
+def _record_count(path):
+    # a record cut short by a crash is left out until it is overwritten
+    return max(0, os.path.getsize(path) - HEADER_SIZE) // CAPTURE_DTYPE.itemsize
+
+
+def build_index(records):
+    """Index entries for records, one per run of valid records from a flight."""
+    valid = np.flatnonzero(records["valid"])
+    flights = records["flight_number"][valid]
+    changes = np.flatnonzero(np.diff(flights)) + 1
+    starts = np.concatenate(([0], changes)) if len(valid) else changes
+    index = np.zeros(len(starts), dtype=INDEX_DTYPE)
+    index["flight_number"] = flights[starts]
+    index["start"] = valid[starts]
+    # records before the first valid one belong to its run
+    if len(index):
+        index["start"][0] = 0
+    return index
+
+
+class CaptureWriter:
+    """Appends records to a capture file, creating it if needed.
+
+    Each append() is one write of one record, flushed to the OS straight
+    away, so a crash loses at most the record being written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".idx"
+        if not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE:
+            with open(path, "wb") as f:
+                f.write(_header())
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+        with open(path, "rb") as f:
+            _check_header(path, f.read(HEADER_SIZE))
+
+        self.count = _record_count(path)
+        self.file = open(path, "r+b")
+        self.file.seek(HEADER_SIZE + self.count * CAPTURE_DTYPE.itemsize)
+        self.file.truncate()
+        self.flight_number = self._last_flight()
+        self.index = open(self.index_path, "ab")
+        self.record = np.zeros(1, dtype=CAPTURE_DTYPE)
+
+    def _last_flight(self):
+        # the index is rewritten from the records on open, in case the last
+        # run of a crashed writer never made it in
+        index = np.zeros(0, dtype=INDEX_DTYPE)
+        if self.count:
+            index = build_index(Capture(self.path).records)
+        index.tofile(self.index_path)
+        return int(index["flight_number"][-1]) if len(index) else None
+
+    def append(self, raw_packet, received, valid):
+        raw_packet = bytes(raw_packet)
+        record = self.record
+        record["raw"] = raw_packet[:PACKET_SIZE].ljust(PACKET_SIZE, b"\0")
+        record["received"] = received
+        record["length"] = min(len(raw_packet), 255)
+        record["valid"] = valid
+        self.file.write(record.tobytes())
+        self.file.flush()
+
+        flight_number = int(record["flight_number"][0])
+        if valid and flight_number != self.flight_number:
+            entry = np.zeros(1, dtype=INDEX_DTYPE)
+            entry["flight_number"] = flight_number
+            entry["start"] = self.count if self.flight_number is not None else 0
+            self.index.write(entry.tobytes())
+            self.index.flush()
+            self.flight_number = flight_number
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+
+class Capture:
+    """Read-only view of a capture file as a structured array, without copying.
+
+    records is a memory map of every whole record in the file when it was
+    opened; records["raw"] holds the frames as received and the packet
+    fields (records["pressure"] and so on) are views into them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            _check_header(path, f.read(HEADER_SIZE))
+        count = _record_count(path)
+        if count:
+            self.records = np.memmap(path, dtype=CAPTURE_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=CAPTURE_DTYPE)
+
+        index_path = path + ".idx"
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        if os.path.exists(index_path):
+            self.index = np.fromfile(index_path, dtype=INDEX_DTYPE)
+            self.index = self.index[self.index["start"] < count]
+        if count and not len(self.index):
+            self.index = build_index(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def runs(self):
+        """(flight_number, start, stop) of each run of records, in file order."""
+        starts = self.index["start"].astype(int)
+        stops = np.append(starts[1:], len(self.records))
+        return list(zip(self.index["flight_number"].tolist(), starts.tolist(), stops.tolist()))
+
+    def flights(self):
+        """{flight_number: number of records}"""
+        flights = {}
+        for flight_number, start, stop in self.runs():
+            flights[flight_number] = flights.get(flight_number, 0) + stop - start
+        return flights
+
+    def flight(self, flight_number):
+        """Records of one flight; a view if the flight is one run, else a copy."""
+        runs = [self.records[start:stop] for number, start, stop in self.runs() if number == flight_number]
+        if len(runs) == 1:
+            return runs[0]
+        if not runs:
+            return self.records[:0]
+        return np.concatenate(runs)
+
+    def raw_packets(self, records=None):
+        """The frames of records (default all) as a list of bytes, cut back to their real length."""
+        records = self.records if records is None else records
+        return [raw.tobytes()[:length] for raw, length in zip(records["raw"], records["length"].tolist())]
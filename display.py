@@ -1,12 +1,17 @@
 import json
+import logging
+import threading
 
 import paho.mqtt.client as mqtt
 
 from waveshare_epd import epd2in9
 from PIL import Image,ImageDraw,ImageFont
 
+from epaper import DisplayWorker, Mailbox, RefreshScheduler
+from history import TieredHistory
+from sparkline import plot_to_image
+
 import numpy as np
-import matplotlib.pyplot as plt
 
 WHITE = 255
 BLACK = 0
@@ -26,7 +31,29 @@ class EPaper():
         self.smol_font = ImageFont.truetype('DejaVuSansMono.ttf', 10)
         self.medium_font = ImageFont.truetype('DejaVuSansMono.ttf', 16)
         self.large_font = ImageFont.truetype('DejaVuSansMono.ttf', 34)
-
+        # partial refreshes, with a full one now and then to clear ghosting
+        self.scheduler = RefreshScheduler(self.epd)
+        # draws the next frame while the panel is refreshing this one
+        self.worker = DisplayWorker(self.epd, show=self.scheduler.show)
+        # readings arrive faster than the panel refreshes, only draw the newest
+        self.mailbox = Mailbox()
+        # every reading, at raw, minute and hour resolution, for the graph
+        self.history = TieredHistory()
+        self.history_lock = threading.Lock()
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def update(self, data):
+        with self.history_lock:
+            self.history.add(data.pressure)
+        self.mailbox.put(data)
+
+    def loop(self):
+        while True:
+            try:
+                self.draw(self.mailbox.get())
+            except Exception:
+                # keep rendering the readings that come after
+                logging.exception("Exception drawing a reading")
 
     def draw(self, data):
             section_width = self.epd.height // 3
@@ -44,6 +71,11 @@ class EPaper():
             pressure = "{:.1f}hPa".format(data.pressure)
             draw.text((10, 80), pressure, font = self.large_font, fill = BLACK)
 
+            with self.history_lock:
+                lows, highs = self.history.series(section_width - 4)
+            graph = plot_to_image(lows, section_width - 4, section_height - 20, highs=highs)
+            screen.paste(graph, (2 * section_width + 4, 10))
+
 
 #            line_height = 16
 #            temp = ("temp", "{:.1f} C".format(packet.temperature))
@@ -63,14 +95,14 @@ class EPaper():
 ##
 #            screen.paste(graph, (0, 2 * section_height + 2))
 
-            self.epd.display(self.epd.getbuffer(screen.rotate(180)))
+            self.worker.submit(screen.rotate(180))
 
 topics = ["indoor"]
 
 if __name__ == '__main__':
     e = EPaper()
     body = {'pressure': 1000.9069290864675, 'temperature': 25.746875, 'humidity': 36.70866768746555}
-    e.draw(Data(temperature=body["temperature"], humidity=body["humidity"], pressure=body["pressure"]))
+    e.update(Data(temperature=body["temperature"], humidity=body["humidity"], pressure=body["pressure"]))
 
     def on_connect(client, userdata, flags, rc):
         print("Connected")
@@ -82,7 +114,8 @@ if __name__ == '__main__':
         print(f"new message on {msg.topic}")
         body = json.loads(msg.payload.decode("utf-8"))
         print(body)
-        e.draw(Data(temperature=body["temperature"], humidity=body["humidity"], pressure=body["pressure"]))
+        e.update(Data(temperature=body["temperature"], humidity=body["humidity"], pressure=body["pressure"]))
+        print(f"{e.mailbox.received} received, {e.mailbox.coalesced} coalesced, {e.worker.shown} shown")
 
     mqtt_client = mqtt.Client()
     mqtt_client.on_connect = on_connect
@@ -0,0 +1,262 @@
+"""
+Display pipeline shared by display.py and lora.py
+
+A refresh keeps the panel busy for seconds while the Pi has nothing to do,
+so the panel is driven from its own thread: DisplayWorker holds the frame
+being shown and at most one frame ready to go after it, and the caller draws
+and encodes the next frame while the current one refreshes.
+
+Readings can arrive faster than the panel refreshes; a Mailbox in front of
+the renderer keeps only the newest one.
+
+A full refresh flashes the panel for ~2 s, a partial one takes ~0.3 s but
+leaves ghosting behind. RefreshScheduler uses partial refreshes and spends a
+full one only once the ghosting budget is used up.
+"""
+import logging
+import threading
+import time
+
+from waveshare_epd import epdbuffer
+
+
+class Mailbox:
+    """One-slot, latest-wins handoff between a producer and a renderer.
+
+    put() never blocks and replaces a value nobody has taken yet; get()
+    blocks for the newest value. received counts put() calls, coalesced the
+    values replaced before they were taken and taken the ones handed out.
+    """
+
+    def __init__(self):
+        self.value = None
+        self.full = False
+        self.received = 0
+        self.coalesced = 0
+        self.taken = 0
+        self.condition = threading.Condition()
+
+    def put(self, value):
+        with self.condition:
+            self.received += 1
+            if self.full:
+                self.coalesced += 1
+            self.value = value
+            self.full = True
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Newest value, or None if nothing arrived within timeout."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.full, timeout):
+                return None
+            value, self.value = self.value, None
+            self.full = False
+            self.taken += 1
+            return value
+
+
+class DisplayWorker:
+    """Double-buffered panel driver.
+
+    submit() encodes an image on the caller's thread into the back buffer and
+    returns; the worker thread pushes it to the panel as soon as the frame in
+    front has finished refreshing. With a frame already waiting, submit()
+    blocks until the worker takes it.
+    """
+
+    def __init__(self, epd, show=None):
+        self.epd = epd
+        self.show = show or epd.display
+        self.back = None
+        self.busy = False
+        self.stopping = False
+        self.shown = 0
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, image):
+        buffer = self.epd.getbuffer(image)
+        with self.condition:
+            while self.back is not None and not self.stopping:
+                self.condition.wait()
+            self.back = buffer
+            self.condition.notify_all()
+
+    def loop(self):
+        while True:
+            with self.condition:
+                while self.back is None and not self.stopping:
+                    self.condition.wait()
+                if self.back is None:
+                    return
+                front, self.back = self.back, None
+                self.busy = True
+                self.condition.notify_all()
+            try:
+                self.show(front)
+            except Exception as e:
+                print(f"Exception {e}")
+            with self.condition:
+                self.busy = False
+                self.shown += 1
+                self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every submitted frame is on the panel."""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.back is None and not self.busy, timeout)
+
+    def close(self):
+        """Show what is still waiting, then stop the worker thread."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.thread.join()
+
+
+# Full and partial refresh for each driver with a partial path, called with
+# (epd, frame, previous frame, mode the panel is in: "full" or "partial")
+def _lut_init_full(epd, frame, previous, mode):
+    if mode != "full":
+        epd.init(epd.lut_full_update)
+    epd.display(frame)
+
+
+def _lut_init_partial(epd, frame, previous, mode):
+    if mode != "partial":
+        epd.init(epd.lut_partial_update)
+    epd.display(frame)
+
+
+def _epd2in9_full(epd, frame, previous, mode):
+    if epd.lut is not epd.lut_full_update:
+        epd.SetLut(epd.lut_full_update)
+    epd.display(frame)
+
+
+def _epd2in9_partial(epd, frame, previous, mode):
+    epd.displayPartial(frame)
+
+
+def _epd2in13_V2_full(epd, frame, previous, mode):
+    if mode != "full":
+        epd.init(epd.FULL_UPDATE)
+    epd.displayPartBaseImage(frame)
+
+
+def _epd2in13_V2_partial(epd, frame, previous, mode):
+    if mode != "partial":
+        epd.init(epd.PART_UPDATE)
+    epd.displayPartial(frame)
+
+
+def _epd1in54_V2_full(epd, frame, previous, mode):
+    epd.displayBaseImage(frame)
+
+
+def _epd1in54_V2_partial(epd, frame, previous, mode):
+    epd.displayPart(frame)
+
+
+def _uc_full(epd, frame, previous, mode):
+    # leaving partial mode takes a fresh init on the UC8151 parts
+    if mode != "full":
+        epd.init()
+    epd.display(frame)
+
+
+def _uc_partial(epd, frame, previous, mode):
+    epd.DisplayPartial(frame)
+
+
+def _epd1in02_full(epd, frame, previous, mode):
+    if mode != "full":
+        epd.Init()
+    epd.Display(frame)
+
+
+def _epd1in02_partial(epd, frame, previous, mode):
+    if mode != "partial":
+        epd.Partial_Init()
+    epd.DisplayPartial(previous, frame)
+
+
+REFRESH_METHODS = {
+    "epd1in02": (_epd1in02_full, _epd1in02_partial),
+    "epd1in54": (_lut_init_full, _lut_init_partial),
+    "epd1in54_V2": (_epd1in54_V2_full, _epd1in54_V2_partial),
+    "epd2in13": (_lut_init_full, _lut_init_partial),
+    "epd2in13_V2": (_epd2in13_V2_full, _epd2in13_V2_partial),
+    "epd2in13d": (_uc_full, _uc_partial),
+    "epd2in9": (_epd2in9_full, _epd2in9_partial),
+    "epd2in9d": (_uc_full, _uc_partial),
+}
+
+
+def _full_only(epd, frame, previous, mode):
+    epd.display(frame)
+
+
+class RefreshScheduler:
+    """Partial refreshes by default, a full one when the ghosting budget is spent.
+
+    A frame gets a full refresh if it is the first one, if max_partials
+    partial refreshes happened since the last full one, if the last full one
+    is max_interval seconds old, or if more than max_area of the frame's
+    bytes changed. That counts the bytes themselves, not the box around
+    them: text at the top and a graph at the bottom changing together are
+    still a small part of the panel. Panels without a partial path always
+    get a full refresh. Use show() as the DisplayWorker's show function; the
+    panel must have been initialised for a full refresh.
+    """
+
+    def __init__(self, epd, max_partials=10, max_interval=600, max_area=0.5, clock=time.monotonic):
+        self.epd = epd
+        self.max_partials = max_partials
+        self.max_interval = max_interval
+        self.max_area = max_area
+        self.clock = clock
+        driver = type(epd).__module__.rsplit(".", 1)[-1]
+        self.full, self.partial = REFRESH_METHODS.get(driver, (_full_only, _full_only))
+        self.mode = "full"
+        self.previous = None
+        self.partials = 0
+        self.last_full = None
+        self.full_refreshes = 0
+        self.partial_refreshes = 0
+
+    def full_reason(self, frame):
+        """Why frame needs a full refresh, None if a partial one will do."""
+        if self.previous is None:
+            return "first frame"
+        if self.full is _full_only:
+            return "no partial refresh"
+        if self.partials >= self.max_partials:
+            return "{} partial refreshes".format(self.partials)
+        if self.clock() - self.last_full >= self.max_interval:
+            return "{:.0f} s since the last full refresh".format(self.clock() - self.last_full)
+        area = epdbuffer.changed_fraction(self.previous, frame)
+        if area > self.max_area:
+            return "{:.0%} of the panel changed".format(area)
+        return None
+
+    def show(self, frame):
+        frame = bytes(frame)
+        if frame == self.previous:
+            return
+        reason = self.full_reason(frame)
+        if reason is not None:
+            logging.debug("full refresh: %s", reason)
+            self.full(self.epd, frame, self.previous, self.mode)
+            self.mode = "full"
+            self.partials = 0
+            self.last_full = self.clock()
+            self.full_refreshes += 1
+        else:
+            self.partial(self.epd, frame, self.previous, self.mode)
+            self.mode = "partial"
+            self.partials += 1
+            self.partial_refreshes += 1
+        self.previous = frame
@@ -0,0 +1,168 @@
+"""
+Bounded sample history for the e-Paper graphs
+
+Screens run for whole flights or days, so history is kept in fixed-size
+NumPy storage with its statistics updated as samples arrive, rather than in
+an array that is copied and rescanned on every packet.
+"""
+import collections
+import time
+
+import numpy as np
+
+
+class RingBuffer:
+    """Last capacity samples, with O(1) append, max and mean.
+
+    max comes from a monotonic deque of (index, value) with falling values,
+    mean from a running sum that is recomputed once per capacity appends so
+    rounding errors don't pile up. count is every sample ever appended,
+    len() the ones still held.
+    """
+
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity)
+        self.capacity = capacity
+        self.count = 0
+        self.total = 0.0
+        self.peaks = collections.deque()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, value):
+        value = float(value)
+        position = self.count % self.capacity
+        if self.count >= self.capacity:
+            self.total -= self.data[position]
+        self.data[position] = value
+        self.total += value
+        self.count += 1
+        if position == self.capacity - 1:
+            self.total = float(self.data.sum())
+
+        while self.peaks and self.peaks[-1][1] <= value:
+            self.peaks.pop()
+        self.peaks.append((self.count - 1, value))
+        if self.peaks[0][0] <= self.count - 1 - self.capacity:
+            self.peaks.popleft()
+
+    def max(self):
+        return self.peaks[0][1] if self.peaks else None
+
+    def mean(self):
+        return self.total / len(self) if self.count else None
+
+    def last(self):
+        return self.data[(self.count - 1) % self.capacity] if self.count else None
+
+    def values(self):
+        """Samples held, oldest first, as a new array."""
+        if self.count <= self.capacity:
+            return self.data[:self.count].copy()
+        position = self.count % self.capacity
+        return np.concatenate((self.data[position:], self.data[:position]))
+
+
+class Rollup:
+    """One resolution of a TieredHistory: the last capacity buckets of seconds.
+
+    Each bucket keeps the min, max, sum and count of its samples and is
+    updated in place while samples fall into it. With seconds None every
+    sample is a bucket of its own.
+    """
+
+    def __init__(self, seconds, capacity):
+        self.seconds = seconds
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.lows = np.zeros(capacity)
+        self.highs = np.zeros(capacity)
+        self.sums = np.zeros(capacity)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.count = 0
+        self.bucket = None
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def add(self, timestamp, value):
+        bucket = None if self.seconds is None else timestamp // self.seconds
+        if bucket is not None and self.count and bucket == self.bucket:
+            i = (self.count - 1) % self.capacity
+            self.lows[i] = min(self.lows[i], value)
+            self.highs[i] = max(self.highs[i], value)
+            self.sums[i] += value
+            self.counts[i] += 1
+            return
+        i = self.count % self.capacity
+        self.times[i] = timestamp if bucket is None else bucket * self.seconds
+        self.lows[i] = self.highs[i] = self.sums[i] = value
+        self.counts[i] = 1
+        self.count += 1
+        self.bucket = bucket
+
+    def oldest(self):
+        """Start of the oldest bucket held, None if empty."""
+        if not self.count:
+            return None
+        return self.times[self.count % self.capacity if self.count > self.capacity else 0]
+
+    def order(self):
+        # ring positions oldest first
+        if self.count <= self.capacity:
+            return np.arange(self.count)
+        return (np.arange(self.capacity) + self.count) % self.capacity
+
+    def since(self, start):
+        """Number of buckets that end after start."""
+        ends = self.times[:len(self)] + (self.seconds or 0)
+        return int(np.count_nonzero(ends >= start))
+
+    def series(self, start=None):
+        """times, lows, highs and means of the buckets from start on, oldest first."""
+        order = self.order()
+        if start is not None:
+            order = order[self.times[order] + (self.seconds or 0) >= start]
+        return (self.times[order], self.lows[order], self.highs[order],
+                self.sums[order] / self.counts[order])
+
+
+class TieredHistory:
+    """Raw samples plus 1 minute and 1 hour rollups, all of fixed size.
+
+    add() updates every tier in O(1). series() answers from the tier that
+    suits the graph, so drawing costs depend on the graph's width and not
+    on how long the history is.
+    """
+
+    def __init__(self, raw=4096, minutes=24 * 60, hours=30 * 24, clock=time.time):
+        self.tiers = [Rollup(None, raw), Rollup(60, minutes), Rollup(3600, hours)]
+        self.clock = clock
+        self.first = None
+
+    def add(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = self.clock()
+        if self.first is None:
+            self.first = timestamp
+        for tier in self.tiers:
+            tier.add(timestamp, value)
+
+    def tier(self, width, start):
+        """Coarsest tier still giving width points after start, else the finest holding it all."""
+        covering = [tier for tier in self.tiers if tier.count and tier.oldest() <= start]
+        if not covering:
+            covering = [self.tiers[-1]]
+        for tier in reversed(covering):
+            if tier.since(start) >= width:
+                return tier
+        return covering[0]
+
+    def series(self, width, seconds=None):
+        """(lows, highs) over the last seconds, by default all of it, for a width pixel graph."""
+        if self.first is None:
+            return np.zeros(0), np.zeros(0)
+        start = self.first if seconds is None else max(self.first, self.clock() - seconds)
+        _, lows, highs, _ = self.tier(width, start).series(start)
+        return lows, highs
@@ -2,76 +2,55 @@
 RFM9x to influxdb bridge
 
 Learn Guide: https://learn.adafruit.com/lora-and-lorawan-for-raspberry-pi
+
+Set LORA_DIO0_PIN to the BCM number of the GPIO wired to the RFM9x DIO0 to
+wake on the radio's RX done interrupt. Without it the radio is polled over
+SPI for packets, which works on any wiring but keeps a core busy.
 """
+import os
 import struct
+import sys
+import time
 
 
-import board
-import busio
-import adafruit_rfm9x
-
-from digitalio import DigitalInOut, Direction, Pull
-
-from influxdb import InfluxDBClient
-
 from waveshare_epd import epd2in9
 from PIL import Image,ImageDraw,ImageFont
 
+from epaper import DisplayWorker, RefreshScheduler
+from sparkline import plot_to_image
+from history import RingBuffer, TieredHistory
+from packet import CRC_OFFSET, PACKET_STRUCT, Packet, crc8
+from capture import CaptureWriter
+from sinkqueue import DROP_NEWEST, DROP_OLDEST, SinkQueue
+
 
 import threading, queue
 
-import crc8
-
-
-epaper_queue = queue.Queue()
-influxdb_queue = queue.Queue()
-
-class Packet:
-    def __init__(self, raw_packet):
-        self.raw_packet = raw_packet
-        parsed_packet = struct.unpack("ddfIIBxxx", raw_packet) # https://docs.python.org/3.7/library/struct.html#format-strings
-        (
-            self.temperature,
-            self.pressure,
-            self.battery_voltage,
-            self.packet_number,
-            self.flight_number,
-            self.crc,
-        ) = parsed_packet
-
-    def validate(self):
-        checksum = crc8.crc8()
-        checksum.update(self.raw_packet[0:28])
-        checksum = int.from_bytes(checksum.digest(), byteorder='big') 
-        return checksum == self.crc
-
-    @property
-    def altitude(self):
-        """Altitude calculation from I forget where"""
-
-        sealevel_pressure = 102800 
-        return (
-            ((sealevel_pressure / self.pressure) ** (1 / 5.257) - 1)
-            * (self.temperature + 273.15)
-        ) / 0.0065
-
-    def for_influxdb(self):
-        """Format from https://github.com/influxdata/influxdb-python#examples"""
-        return [{
-            "measurement": "packet",
-            "fields": {
-                "flight_number": self.flight_number,
-                "packet_number": self.packet_number,
-                "pressure": self.pressure,
-                "battery_voltage": self.battery_voltage,
-                "altitude": self.altitude,
-                "temperature": self.temperature,
-                "valid": self.validate(),
-            },
-        }]
 
+PRESSURE_HISTORY = 4096
+# every frame received, valid or not, see capture.py
+CAPTURE_PATH = "lora.capture"
+
+# The sink queues are bounded so a stalled sink can't run the Pi out of
+# memory. The screen only cares about the newest packets; InfluxDB keeps the
+# backlog it has and loses what comes after, which is still in the capture.
+EPAPER_QUEUE_SIZE = 100
+EPAPER_QUEUE_POLICY = DROP_OLDEST
+INFLUXDB_QUEUE_SIZE = 10000
+INFLUXDB_QUEUE_POLICY = DROP_NEWEST
+# print the queue counters every this many packets
+QUEUE_STATS_EVERY = 1000
+
+epaper_queue = SinkQueue(EPAPER_QUEUE_SIZE, EPAPER_QUEUE_POLICY)
+influxdb_queue = SinkQueue(INFLUXDB_QUEUE_SIZE, INFLUXDB_QUEUE_POLICY)
 
 def get_rfm9x():
+    # radio libraries are imported here so the rest runs off the Pi (benchmarks/pipeline.py)
+    import board
+    import busio
+    import adafruit_rfm9x
+    from digitalio import DigitalInOut
+
     CS = DigitalInOut(board.D26)
     RESET = DigitalInOut(board.D16)
     spi = busio.SPI(board.SCK_1, MOSI=board.MOSI_1, MISO=board.MISO_1)
@@ -80,26 +59,120 @@ def get_rfm9x():
     return rfm9x
 
 
-def loop(rfm9x):
-    """May need to run with PYTHONUNBUFFERED=1 if you aren't seeing . and !"""
+# BCM number of the GPIO wired to the RFM9x DIO0, which goes high on RX done.
+# There is no default: on a pin DIO0 isn't wired to no edge ever comes, so
+# unset means PollingReceiver.
+DIO0_PIN = os.environ.get("LORA_DIO0_PIN") or None
+# Without a DIO0 edge, look at the radio this often anyway in case one was missed
+IDLE_POLL_S = 1.0
+# How long receive() may take to read out a packet that has landed
+FIFO_READ_TIMEOUT_S = 0.1
+
+
+class Receiver:
+    """Waits on the radio's RX done interrupt instead of polling it over SPI.
+
+    The RFM9x raises DIO0 once a packet is in its FIFO. The edge wakes
+    receive(), which stamps the packet with the time of the interrupt and
+    only then reads it out of the radio. polled counts the packets that
+    were only found by the IDLE_POLL_S check, which means DIO0 isn't wired
+    to dio0_pin.
+    """
+
+    def __init__(self, rfm9x, dio0_pin):
+        import RPi.GPIO as GPIO
+
+        self.rfm9x = rfm9x
+        self.dio0_pin = dio0_pin
+        self.landed = threading.Event()
+        self.stamp = None
+        self.polled = 0
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(dio0_pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+        GPIO.add_event_detect(dio0_pin, GPIO.RISING, callback=self.on_dio0)
+        # receive mode, which also maps DIO0 to RX done
+        rfm9x.listen()
+
+    def on_dio0(self, channel):
+        self.stamp = time.time_ns()
+        self.landed.set()
+
+    def receive(self):
+        """(ns since the epoch received, raw packet) of the next packet, however long it takes"""
+        while True:
+            if not self.landed.wait(IDLE_POLL_S):
+                if not self.rfm9x.rx_done():
+                    continue
+                self.polled += 1
+                print(f"\nPacket found without a DIO0 edge on GPIO {self.dio0_pin} "
+                      f"({self.polled} so far), check LORA_DIO0_PIN")
+            self.landed.clear()
+            stamp, self.stamp = self.stamp or time.time_ns(), None
+            raw_packet = self.rfm9x.receive(timeout=FIFO_READ_TIMEOUT_S)
+            if raw_packet is not None:
+                return stamp, raw_packet
+
+
+class PollingReceiver:
+    """Receiver for radios without DIO0 wired: asks the radio over SPI until a packet is in."""
+
+    def __init__(self, rfm9x):
+        self.rfm9x = rfm9x
+
+    def receive(self):
+        """(ns since the epoch received, raw packet) of the next packet, however long it takes"""
+        while True:
+            raw_packet = self.rfm9x.receive()
+            if raw_packet is not None:
+                return time.time_ns(), raw_packet
+
+
+def get_receiver(rfm9x):
+    """Receiver for the wiring LORA_DIO0_PIN describes."""
+    if DIO0_PIN is None:
+        print("LORA_DIO0_PIN not set, polling the radio for packets")
+        return PollingReceiver(rfm9x)
+    return Receiver(rfm9x, dio0_pin())
+
+
+def dio0_pin():
+    """LORA_DIO0_PIN as a BCM GPIO number, exits with a message if it isn't one."""
+    try:
+        pin = int(DIO0_PIN)
+    except ValueError:
+        pin = None
+    if pin is None or not 0 <= pin <= 27:
+        sys.exit(f"LORA_DIO0_PIN={DIO0_PIN!r} is not a GPIO number: expected the BCM number (0-27) "
+                 f"of the pin wired to the RFM9x DIO0, or leave it unset to poll the radio")
+    return pin
+
+
+def loop(receiver, capture):
+    """May need to run with PYTHONUNBUFFERED=1 if you aren't seeing !"""
 
     while True:
-        print(".", end="")
-        raw_packet = rfm9x.receive()
-        if raw_packet is None:
-            continue
+        received, raw_packet = receiver.receive()
 
         try:
-            parsed_packet = Packet(raw_packet)
-            parsed_packet.validate()
+            parsed_packet = Packet(raw_packet, received)
         except struct.error:
+            capture.append(raw_packet, received, False)
             print("Invalid packet")
             print(raw_packet)
             continue
+        capture.append(raw_packet, received, parsed_packet.validate())
 
         epaper_queue.put(parsed_packet)
         influxdb_queue.put(parsed_packet)
         print("!", end="")
+        if influxdb_queue.received % QUEUE_STATS_EVERY == 0:
+            print_queue_stats()
+
+
+def print_queue_stats():
+    for name, sink_queue in (("epaper", epaper_queue), ("influxdb", influxdb_queue)):
+        print(f"\n{name}: {sink_queue.received} received, {sink_queue.dropped} dropped, "
+              f"{sink_queue.qsize()} queued, high water {sink_queue.high_water}/{sink_queue.maxsize}")
 
 
 class EPaper():
@@ -112,14 +185,24 @@ class EPaper():
         self.smol_font = ImageFont.truetype('DejaVuSansMono.ttf', 10)
         self.medium_font = ImageFont.truetype('DejaVuSansMono.ttf', 16)
         self.large_font = ImageFont.truetype('DejaVuSansMono.ttf', 34)
+        # partial refreshes, with a full one now and then to clear ghosting
+        self.scheduler = RefreshScheduler(self.epd)
+        # draws the next frame while the panel is refreshing this one
+        self.worker = DisplayWorker(self.epd, show=self.scheduler.show)
 
-        self.pressures = np.array([])
+        # the last PRESSURE_HISTORY packets, for the stats and the graph
+        self.pressures = RingBuffer(PRESSURE_HISTORY)
+        # the whole flight at raw, minute and hour resolution, for the graph
+        self.history = TieredHistory()
 
     def loop(self):
         while True:
             packet = self.queue.get()
-            self.pressures = np.append(self.pressures, packet.pressure)
-            if len(self.pressures) % 20 == 0:
+            self.pressures.append(packet.pressure)
+            # the queue can back up during a refresh, so not the time now
+            received = packet.received / 1e9 if packet.received is not None else None
+            self.history.add(packet.pressure, received)
+            if self.pressures.count % 20 == 0:
                 self.draw(packet)
 
     def draw(self, packet):
@@ -135,7 +218,7 @@ class EPaper():
             draw.text((0, 20), height, font = self.large_font, fill = BLACK)
 
             max_pressure = self.pressures.max() / 1000.0
-            average_pressure  = np.average(self.pressures) / 1000.0
+            average_pressure  = self.pressures.mean() / 1000.0
             max_height = "max:{:.1f}M/avg:{:.1f}M".format(max_pressure, average_pressure)
             draw.text((0, self.epd.height / 3 - 14), max_height, font = self.smol_font, fill = BLACK)
 
@@ -153,63 +236,98 @@ class EPaper():
             draw.line((0, section_height, self.epd.width, section_height))
             draw.line((0, 2 * section_height, self.epd.width, 2 * section_height))
 
-            graph = plot_to_image(self.pressures, section_width, section_height)
+            lows, highs = self.history.series(section_width)
+            graph = plot_to_image(lows, section_width, section_height, highs=highs)
 
             screen.paste(graph, (0, 2 * section_height + 2))
 
-            self.epd.display(self.epd.getbuffer(screen.rotate(180)))
-
-def plot_to_image(data, width, height, dpi = 100):
-    plt.figure(figsize=[width / dpi, height / dpi], dpi=dpi)
-
-    fig = plt.gcf()
-    ax = plt.Axes(fig, [0., 0., 1., 1.])
-    ax.set_axis_off()
-    fig.add_axes(ax)
-
-    plt.plot(data, linewidth = 1)
-
-    fig.canvas.draw()
-
-    image =  Image.frombytes('RGB', fig.canvas.get_width_height(),fig.canvas.tostring_rgb())
-
-    plt.close()
-
-    return image
-
-
-import numpy as np
-import matplotlib.pyplot as plt
+            self.worker.submit(screen.rotate(180))
 
 WHITE = 255
 BLACK = 0
 
+# A batch is written once it has this many points or its first point is this old
+INFLUXDB_BATCH_SIZE = 500
+INFLUXDB_BATCH_LATENCY_S = 1.0
+# Failed writes are retried after this long, doubling up to the max
+INFLUXDB_RETRY_S = 0.5
+INFLUXDB_RETRY_MAX_S = 30.0
+
+
 class InfluxDB():
-    def __init__(self, queue):
-        self.client = InfluxDBClient(host="192.168.1.20", database="hummingbird")
+    """Writes packets to InfluxDB in batches, one request per batch.
+
+    Each point carries the time the radio received its packet, so holding
+    points back for a batch doesn't move them in the database. A batch that
+    fails is retried with backoff until it goes through; one InfluxDB
+    rejects outright (a 4xx) is dropped and counted.
+    """
+
+    def __init__(self, queue, client=None, batch_size=INFLUXDB_BATCH_SIZE, batch_latency=INFLUXDB_BATCH_LATENCY_S):
+        if client is None:
+            from influxdb import InfluxDBClient
+            client = InfluxDBClient(host="192.168.1.20", database="hummingbird")
+        self.client = client
         self.queue = queue
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+        self.requests = 0
+        self.written = 0
+        self.rejected = 0
 
     def loop(self):
+        batch = []
+        deadline = None
+        while True:
+            try:
+                timeout = max(0, deadline - time.monotonic()) if batch else None
+                packet = self.queue.get(timeout=timeout)
+                if not batch:
+                    deadline = time.monotonic() + self.batch_latency
+                batch.extend(packet.for_influxdb())
+            except queue.Empty:
+                pass
+            except Exception as e:
+                print(f"Exception {e}")
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self.write(batch)
+                batch = []
+
+    def write(self, points):
+        delay = INFLUXDB_RETRY_S
         while True:
             try:
-                packet = self.queue.get()
-                self.client.write_points(packet.for_influxdb())
+                self.client.write_points(points, time_precision="n")
+                self.requests += 1
+                self.written += len(points)
+                return
             except Exception as e:
                 print(f"Exception {e}")
+                # InfluxDBClientError carries the HTTP status, a 4xx won't get better
+                if 400 <= (getattr(e, "code", None) or 0) < 500:
+                    self.rejected += len(points)
+                    return
+            time.sleep(delay)
+            delay = min(delay * 2, INFLUXDB_RETRY_MAX_S)
 
 
 def main():
-    rfm9x = get_rfm9x()
+    if DIO0_PIN is not None:
+        # a bad value stops here, before the radio is touched
+        dio0_pin()
+    receiver = get_receiver(get_rfm9x())
     epaper_thread = EPaper(epaper_queue)
     influxdb_thread = InfluxDB(influxdb_queue)
     threading.Thread(target=influxdb_thread.loop).start()
     threading.Thread(target=epaper_thread.loop).start()
     print("Starting loop")
-    loop(rfm9x)
+    loop(receiver, CaptureWriter(CAPTURE_PATH))
 
 
-def fake_packet():
-    return Packet(bytearray(b'b\xdd\xbeAL\x86\x01\x00\x00\x00\x00\x00r\x02\x00\x00*\x00\x00\x00'))
+def fake_packet(packet_number=42, flight_number=0, pressure=100296.0, temperature=23.8):
+    raw_packet = bytearray(PACKET_STRUCT.pack(temperature, pressure, 3.7, packet_number, flight_number, 0))
+    raw_packet[CRC_OFFSET] = crc8(raw_packet[:CRC_OFFSET])
+    return Packet(bytes(raw_packet), time.time_ns())
 
 if __name__ == "__main__":
     # epaper_thread = EPaper(epaper_queue)
@@ -0,0 +1,139 @@
+"""
+Telemetry packets sent by the flight computer over LoRa
+
+Each packet is 32 bytes, little-endian:
+
+    double temperature, double pressure, float battery_voltage,
+    uint32 packet_number, uint32 flight_number, uint8 crc, 3 bytes padding
+
+Packet decodes one packet; PACKET_DTYPE and decode() read a whole batch of
+them (a burst, a capture file) into a NumPy record array in one call.
+
+The crc is CRC-8 with polynomial 0x07 and initial value 0 (the crc8
+package's default) over the first CRC_OFFSET bytes.
+"""
+import struct
+
+import numpy as np
+
+
+PACKET_STRUCT = struct.Struct("<ddfIIBxxx") # https://docs.python.org/3.7/library/struct.html#format-strings
+PACKET_SIZE = PACKET_STRUCT.size
+
+PACKET_DTYPE = np.dtype({
+    "names": ["temperature", "pressure", "battery_voltage", "packet_number", "flight_number", "crc"],
+    "formats": ["<f8", "<f8", "<f4", "<u4", "<u4", "u1"],
+    "offsets": [0, 8, 16, 20, 24, 28],
+    "itemsize": PACKET_SIZE,
+})
+
+CRC_OFFSET = 28
+
+SEALEVEL_PRESSURE = 102800
+
+
+def _crc8_entry(byte):
+    crc = byte
+    for _ in range(8):
+        crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+CRC8_TABLE = bytes(_crc8_entry(byte) for byte in range(256))
+CRC8_TABLE_ARRAY = np.frombuffer(CRC8_TABLE, dtype=np.uint8)
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def validate(packets):
+    """Bool array, True where a packet's crc matches.
+
+    packets is a buffer of back to back raw packets or a decode() result.
+    All packets advance through the table together, one byte column at a
+    time.
+    """
+    rows = np.frombuffer(packets, dtype=np.uint8).reshape(-1, PACKET_SIZE)
+    crc = np.zeros(len(rows), dtype=np.uint8)
+    for column in range(CRC_OFFSET):
+        crc = CRC8_TABLE_ARRAY[crc ^ rows[:, column]]
+    return crc == rows[:, CRC_OFFSET]
+
+
+def altitude(pressure, temperature):
+    """Altitude calculation from I forget where, works on arrays too"""
+    return (
+        ((SEALEVEL_PRESSURE / pressure) ** (1 / 5.257) - 1)
+        * (temperature + 273.15)
+    ) / 0.0065
+
+
+def decode(raw_packets):
+    """Record array over a buffer of back to back packets, without copying.
+
+    Raises ValueError if the buffer is not a whole number of packets.
+    """
+    if len(raw_packets) % PACKET_SIZE:
+        raise ValueError("{} bytes is not a whole number of {} byte packets".format(len(raw_packets), PACKET_SIZE))
+    return np.frombuffer(raw_packets, dtype=PACKET_DTYPE)
+
+
+class Packet:
+    __slots__ = (
+        "raw_packet",
+        "temperature",
+        "pressure",
+        "battery_voltage",
+        "packet_number",
+        "flight_number",
+        "crc",
+        "valid",
+        "received",
+    )
+
+    def __init__(self, raw_packet, received=None):
+        self.raw_packet = raw_packet
+        # time.time_ns() the radio had it, None if unknown
+        self.received = received
+        (
+            self.temperature,
+            self.pressure,
+            self.battery_voltage,
+            self.packet_number,
+            self.flight_number,
+            self.crc,
+        ) = PACKET_STRUCT.unpack(raw_packet)
+        self.valid = None
+
+    def validate(self):
+        # worked out once, for_influxdb() asks again
+        if self.valid is None:
+            self.valid = crc8(self.raw_packet[0:CRC_OFFSET]) == self.crc
+        return self.valid
+
+    @property
+    def altitude(self):
+        return altitude(self.pressure, self.temperature)
+
+    def for_influxdb(self):
+        """Format from https://github.com/influxdata/influxdb-python#examples"""
+        point = {
+            "measurement": "packet",
+            "fields": {
+                "flight_number": self.flight_number,
+                "packet_number": self.packet_number,
+                "pressure": self.pressure,
+                "battery_voltage": self.battery_voltage,
+                "altitude": self.altitude,
+                "temperature": self.temperature,
+                "valid": self.validate(),
+            },
+        }
+        if self.received is not None:
+            # ns since the epoch, written with time_precision="n"
+            point["time"] = self.received
+        return [point]
@@ -0,0 +1,76 @@
+"""
+Bounded queues between the LoRa receive loop and its sinks
+
+An unbounded queue in front of a sink that stalls (InfluxDB down, a slow
+panel) grows until the Pi runs out of memory. A SinkQueue holds at most
+maxsize items and, once full, does what its policy says:
+
+    BLOCK         put() waits for room, like queue.Queue
+    DROP_OLDEST   the oldest queued item is dropped to make room
+    DROP_NEWEST   the item being put is dropped
+    COALESCE      everything queued is dropped, only the newest item is kept
+
+received, dropped and high_water (the deepest the queue has been) count
+what happened so far; counters() has them all.
+"""
+import queue
+
+
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+COALESCE = "coalesce"
+
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+
+class SinkQueue(queue.Queue):
+    def __init__(self, maxsize, policy=BLOCK):
+        if policy not in POLICIES:
+            raise ValueError("unknown policy {!r}, expected one of {}".format(policy, ", ".join(POLICIES)))
+        if maxsize <= 0:
+            raise ValueError("a SinkQueue needs a maxsize, got {}".format(maxsize))
+        super().__init__(maxsize)
+        self.policy = policy
+        self.received = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def put(self, item, block=True, timeout=None):
+        if self.policy == BLOCK:
+            return super().put(item, block, timeout)
+        with self.not_full:
+            if self.policy == COALESCE:
+                while self._qsize():
+                    self._drop()
+            elif self._qsize() >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.received += 1
+                    self.dropped += 1
+                    return
+                self._drop()
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _put(self, item):
+        super()._put(item)
+        self.received += 1
+        self.high_water = max(self.high_water, self._qsize())
+
+    def _drop(self):
+        # called with the mutex held, the item never reaches the sink
+        self.dropped += 1
+        self.unfinished_tasks -= 1
+        return self._get()
+
+    def counters(self):
+        with self.mutex:
+            return {
+                "policy": self.policy,
+                "maxsize": self.maxsize,
+                "depth": self._qsize(),
+                "received": self.received,
+                "dropped": self.dropped,
+                "high_water": self.high_water,
+            }
@@ -0,0 +1,65 @@
+"""
+1-bit line chart for the e-Paper screens
+
+Rasterizes a series straight into a black and white PIL image with NumPy,
+one column of the chart per pixel, instead of going through matplotlib.
+"""
+import numpy as np
+from PIL import Image
+
+
+def columns(values, width, highs=None):
+    """Lowest and highest value each of width pixel columns has to cover.
+
+    Longer series are split into one bucket per column and keep each
+    bucket's min and max, so spikes survive the downsampling; shorter ones
+    are stretched over the width. Each column also reaches back to where the
+    previous one ended, which keeps the line connected. With highs, values
+    are the lows of already rolled up points and highs their maxima.
+    """
+    lows = np.asarray(values, dtype=float)
+    highs = lows if highs is None else np.asarray(highs, dtype=float)
+    if len(lows) >= width:
+        starts = np.linspace(0, len(lows), width + 1).astype(int)
+        low = np.minimum.reduceat(lows, starts[:-1])
+        high = np.maximum.reduceat(highs, starts[:-1])
+        last = (lows[starts[1:] - 1] + highs[starts[1:] - 1]) / 2
+    elif len(lows) > 1:
+        points = np.linspace(0, width - 1, len(lows))
+        low = np.interp(np.arange(width), points, lows)
+        high = np.interp(np.arange(width), points, highs)
+        last = (low + high) / 2
+    else:
+        low = np.full(width, lows[0])
+        high = np.full(width, highs[0])
+        last = (low + high) / 2
+    previous = np.concatenate((last[:1], last[:-1]))
+    return np.minimum(low, previous), np.maximum(high, previous)
+
+
+def plot_to_image(data, width, height, low=None, high=None, highs=None):
+    """'1' image of width x height with data drawn as a black line on white.
+
+    The y axis runs from low to high, by default the min and max of data.
+    Passing highs draws the band between data and highs, as for the
+    (lows, highs) of history.TieredHistory.series().
+    """
+    rows = np.arange(height)[:, None]
+    if len(data) == 0 or width <= 0:
+        return Image.new('1', (width, height), 255)
+
+    column_low, column_high = columns(data, width, highs)
+    if low is None:
+        low = column_low.min()
+    if high is None:
+        high = column_high.max()
+    span = (high - low) or 1.0
+    # row 0 is the top of the image, so high values get small row numbers
+    scale = (height - 1) / span
+    top = np.clip(np.rint((high - column_high) * scale), 0, height - 1)
+    bottom = np.clip(np.rint((high - column_low) * scale), 0, height - 1)
+    if high == low:
+        top = bottom = np.full(width, (height - 1) // 2)
+
+    line = (rows >= top) & (rows <= bottom)
+    return Image.fromarray(~line)
@@ -0,0 +1,63 @@
+# *****************************************************************************
+# * | File        :	  __init__.py
+# * | Function    :   Registry of the e-Paper drivers in this package
+# * | Info        :
+# *----------------
+# * | Info        :   Panels are looked up by name, e.g. "2in9", and their
+# * |             :   driver module is only imported when it is asked for.
+# * |             :   Importing the package or a driver does not touch the
+# * |             :   hardware, epdconfig opens it on the first init().
+# ******************************************************************************
+
+import collections
+import importlib
+
+# planes: 1 for black and white, 2 for black and red / yellow
+# partial: the driver can refresh without a full flash
+# gray: the driver has display_4Gray()
+Panel = collections.namedtuple('Panel', ['name', 'width', 'height', 'planes', 'partial', 'gray'])
+
+PANELS = collections.OrderedDict((panel.name, panel) for panel in [
+    Panel('1in02',    80,  128, 1, True,  False),
+    Panel('1in54',    200, 200, 1, True,  False),
+    Panel('1in54_V2', 200, 200, 1, True,  False),
+    Panel('1in54b',   200, 200, 2, False, False),
+    Panel('1in54c',   152, 152, 2, False, False),
+    Panel('2in13',    122, 250, 1, True,  False),
+    Panel('2in13_V2', 122, 250, 1, True,  False),
+    Panel('2in13bc',  104, 212, 2, False, False),
+    Panel('2in13d',   104, 212, 1, True,  False),
+    Panel('2in7',     176, 264, 1, False, True),
+    Panel('2in7b',    176, 264, 2, False, False),
+    Panel('2in9',     128, 296, 1, True,  False),
+    Panel('2in9bc',   128, 296, 2, False, False),
+    Panel('2in9d',    128, 296, 1, True,  False),
+    Panel('4in2',     400, 300, 1, False, True),
+    Panel('4in2bc',   400, 300, 2, False, False),
+    Panel('5in83',    600, 448, 1, False, False),
+    Panel('5in83bc',  600, 448, 2, False, False),
+    Panel('7in5',     640, 384, 1, False, False),
+    Panel('7in5_V2',  800, 480, 1, False, False),
+    Panel('7in5bc',   640, 384, 2, False, False),
+    Panel('7in5bc_V2', 800, 480, 2, False, False),
+])
+
+
+def panel(name):
+    """Registry entry for a panel name such as "2in9" or "epd2in9"."""
+    if name.startswith('epd'):
+        name = name[3:]
+    try:
+        return PANELS[name]
+    except KeyError:
+        raise ValueError('Unknown panel {!r}, expected one of: {}'.format(name, ', '.join(PANELS)))
+
+
+def driver(name):
+    """Driver module of a panel, imported on first use."""
+    return importlib.import_module('.epd' + panel(name).name, __name__)
+
+
+def EPD(name):
+    """New, not yet initialised EPD object for a panel."""
+    return driver(name).EPD()
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 80
@@ -43,6 +44,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.frame_digest = epdbuffer.FrameDigest()
     
     #full screen update LUT
 
@@ -107,16 +109,15 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a whole frame or LUT with DC/CS held once
+    def send_data_bulk(self, data):
+        epdconfig.send_data_bulk(data)
         
     def ReadBusy(self):
         logging.debug("e-Paper busy")
         self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        busy =not(busy & 0x01)
-        while(busy):
-            self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
-            busy =not(busy & 0x01)
+        epdconfig.wait_busy(0)      # 0: busy, 1: idle
         epdconfig.delay_ms(800)
         logging.debug("e-Paper busy release")        
 
@@ -127,21 +128,17 @@ class EPD:
 
     def SetFulltReg(self):
         self.send_command(0x23)
-        for count in range(0, 42):
-            self.send_data(self.lut_w1[count]) 
+        self.send_data_bulk(self.lut_w1[0:42])
         
         self.send_command(0x24)
-        for count in range(0, 42):
-            self.send_data(self.lut_b1[count])     
+        self.send_data_bulk(self.lut_b1[0:42])
 
     def SetPartReg(self):
         self.send_command(0x23)
-        for count in range(0, 42):
-            self.send_data(self.lut_w[count]) 
+        self.send_data_bulk(self.lut_w[0:42])
         
         self.send_command(0x24)
-        for count in range(0, 42):
-            self.send_data(self.lut_b[count])     
+        self.send_data_bulk(self.lut_b[0:42])
 
     def Init(self):
         if (epdconfig.module_init() != 0):
@@ -237,30 +234,13 @@ class EPD:
         return 0
     
     def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def Display(self, image):
         if (image == None):
             return
+        if self.frame_digest.unchanged(image):
+            return
         # Width = (self.width % 8 == 0)? (self.width / 8 ): (self.width / 8 + 1)
         if(self.width % 8 == 0):
             Width = self.width / 8
@@ -268,15 +248,12 @@ class EPD:
             Width = self.width / 8 + 1
             
         self.send_command(0x10)
-        for j in range(0, self.height):
-            for i in range(0, int(Width)):
-                self.send_data(0xff)  
+        self.send_data_bulk([0xff] * (int(Width) * self.height))
         
         self.send_command(0x13)
-        for j in range(0, self.height):
-            for i in range(0, int(Width)):
-                self.send_data(image[i + j * int(Width)])  
+        self.send_data_bulk(image)
         self.TurnOnDisplay()
+        self.frame_digest.shown()
         
     def Clear(self):
         # Width = (self.width % 8 == 0)? (self.width / 8 ): (self.width / 8 + 1)
@@ -288,17 +265,16 @@ class EPD:
         Height = self.height
         
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(0x00)  
+        self.send_data_bulk([0x00] * (int(Width) * Height))
         
         self.send_command(0x13)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(0xff)  
+        self.send_data_bulk([0xff] * (int(Width) * Height))
         self.TurnOnDisplay()
+        self.frame_digest.reset()
 
     def DisplayPartial(self, old_Image, Image):
+        if self.frame_digest.unchanged(Image):
+            return
 
         # Set partial Windows */
         self.send_command(0x91)		#This command makes the display enter partial mode
@@ -310,26 +286,16 @@ class EPD:
         self.send_data(127)  #y-end
         self.send_data(0x00)
        
-        # Width = (self.width % 8 == 0)? (self.width / 8 ): (self.width / 8 + 1)
-        if(self.width % 8 == 0):
-            Width = self.width / 8
-        else:
-            Width = self.width / 8 + 1
-            
-        Height = self.height
         # send data
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(old_Image[i + j * int(Width)])
+        self.send_data_bulk(old_Image)
 
         self.send_command(0x13)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(Image[i + j * int(Width)])
+        self.send_data_bulk(Image)
 
         # Set partial refresh
         self.TurnOnDisplay()
+        self.frame_digest.shown()
 
     def Sleep(self):
         self.send_command(0x50)
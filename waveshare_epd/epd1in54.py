@@ -81,6 +81,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -94,6 +95,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.frame_digest = epdbuffer.FrameDigest()
 
     lut_full_update = [
         0x02, 0x02, 0x01, 0x11, 0x12, 0x12, 0x22, 0x22, 
@@ -129,11 +131,14 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a whole frame or LUT with DC/CS held once
+    def send_data_bulk(self, data):
+        epdconfig.send_data_bulk(data)
         
     def ReadBusy(self):
         logging.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)
+        epdconfig.wait_busy(1)      # 0: idle, 1: busy
         logging.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
@@ -164,7 +169,14 @@ class EPD:
         self.send_data(y & 0xFF)
         self.send_data((y >> 8) & 0xFF)
         # self.ReadBusy()
-        
+
+    def WriteFrame(self, data):
+        # RAM address auto-increments (X then Y, see DATA_ENTRY_MODE_SETTING),
+        # so the whole window is streamed after a single cursor set
+        self.SetCursor(0, 0)
+        self.send_command(0x24) # WRITE_RAM
+        self.send_data_bulk(data)
+
     def init(self, lut):
         if (epdconfig.module_init() != 0):
             return -1
@@ -195,58 +207,35 @@ class EPD:
         
         # set the look-up table register
         self.send_command(0x32)
-        for i in range(0, len(lut)):
-            self.send_data(lut[i])
+        self.send_data_bulk(lut)
         # EPD hardware init end
         return 0
 
     def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, image):
         if (image == None):
             return
+        if self.frame_digest.unchanged(image):
+            return
             
-        self.SetWindow(0, 0, self.width, self.height)
-        for j in range(0, self.height):
-            self.SetCursor(0, j)
-            self.send_command(0x24)
-            for i in range(0, int(self.width / 8)):
-                self.send_data(image[i + j * int(self.width / 8)])   
+        self.SetWindow(0, 0, self.width - 1, self.height - 1)
+        self.WriteFrame(image)
         self.TurnOnDisplay()
+        # the controller flips between its two frame memories on every
+        # refresh, write the frame again so the next partial refresh
+        # starts from matching memories
+        self.WriteFrame(image)
+        self.frame_digest.shown()
         
     def Clear(self, color):
-        # self.SetWindow(0, 0, self.width - 1, self.height - 1)
         # send the color data
-        self.SetWindow(0, 0, self.width, self.height)
-        # epdconfig.digital_write(self.dc_pin, 1)
-        # epdconfig.digital_write(self.cs_pin, 0)
-        for j in range(0, self.height):
-            self.SetCursor(0, j)
-            self.send_command(0x24)
-            for i in range(0, int(self.width / 8)):
-                self.send_data(color)
-        # epdconfig.digital_write(self.cs_pin, 1)
+        self.SetWindow(0, 0, self.width - 1, self.height - 1)
+        self.WriteFrame([color] * (int(self.width / 8) * self.height))
         self.TurnOnDisplay()
+        self.WriteFrame([color] * (int(self.width / 8) * self.height))
+        self.frame_digest.reset()
 
     def sleep(self):
         self.send_command(0x10) # DEEP_SLEEP_MODE
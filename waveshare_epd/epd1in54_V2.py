@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -42,6 +43,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.frame_digest = epdbuffer.FrameDigest()
         
     # Hardware reset
     def reset(self):
@@ -63,11 +65,14 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a whole frame or LUT with DC/CS held once
+    def send_data_bulk(self, data):
+        epdconfig.send_data_bulk(data)
         
     def ReadBusy(self):
         logging.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):
-            epdconfig.delay_ms(100)
+        epdconfig.wait_busy(1)      # 0: idle, 1: busy
         logging.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
@@ -133,69 +138,66 @@ class EPD:
         
     def Clear(self, color):
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, int(self.width / 8)):
-                self.send_data(color)
+        self.send_data_bulk([color] * (int(self.width / 8) * self.height))
         self.TurnOnDisplay()
+        self.frame_digest.reset()
         
     def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, image):
         if (image == None):
             return
+        if self.frame_digest.unchanged(image):
+            return
             
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, int(self.width / 8)):
-                self.send_data(image[i + j * int(self.width / 8)])   
+        self.send_data_bulk(image)
         self.TurnOnDisplay()
+        self.frame_digest.shown()
         
     def displayPartBaseImage(self, image):
         if (image == None):
             return
+        # always refreshes, but what the panel shows has to be known to display()
+        self.frame_digest.unchanged(image)
             
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, int(self.width / 8)):
-                self.send_data(image[i + j * int(self.width / 8)])
+        self.send_data_bulk(image)
         
         self.send_command(0x26)
-        for j in range(0, self.height):
-            for i in range(0, self.width / 8):
-                self.send_data(image[i + j * int(self.width / 8)])
+        self.send_data_bulk(image)
                 
         self.TurnOnDisplayPart()
+        self.frame_digest.shown()
         
+    def displayBaseImage(self, image):
+        # displayPartBaseImage() with the full waveform, for clearing the
+        # ghosting partial refreshes leave behind
+        if (image == None):
+            return
+        self.frame_digest.unchanged(image)
+
+        self.send_command(0x24)
+        self.send_data_bulk(image)
+
+        self.send_command(0x26)
+        self.send_data_bulk(image)
+
+        self.TurnOnDisplay()
+        self.frame_digest.shown()
+
     def displayPart(self, image):
         if (image == None):
             return
+        if self.frame_digest.unchanged(image):
+            return
             
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, int(self.width / 8)):
-                self.send_data(image[i + j * int(self.width / 8)])
+        self.send_data_bulk(image)
                 
         self.TurnOnDisplayPart()
+        self.frame_digest.shown()
         
     def sleep(self):
         self.send_command(0x10) # DEEP_SLEEP_MODE
@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -42,6 +43,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.frame_digest = epdbuffer.FrameDigest()
 
     lut_vcom0 = [0x0E, 0x14, 0x01, 0x0A, 0x06, 0x04, 0x0A, 0x0A, 0x0F, 0x03, 0x03, 0x0C, 0x06, 0x0A, 0x00]
     lut_w = [0x0E, 0x14, 0x01, 0x0A, 0x46, 0x04, 0x8A, 0x4A, 0x0F, 0x83, 0x43, 0x0C, 0x86, 0x0A, 0x04]
@@ -72,40 +74,35 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a whole frame or LUT with DC/CS held once
+    def send_data_bulk(self, data):
+        epdconfig.send_data_bulk(data)
         
     def ReadBusy(self):
         logging.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):
-            epdconfig.delay_ms(100)    
+        epdconfig.wait_busy(0)      # 0: busy, 1: idle
         logging.debug("e-Paper busy release")
       
     def set_lut_bw(self):
         self.send_command(0x20) # vcom
-        for count in range(0, 15):
-            self.send_data(self.lut_vcom0[count])
+        self.send_data_bulk(self.lut_vcom0[0:15])
         self.send_command(0x21) # ww --
-        for count in range(0, 15):
-            self.send_data(self.lut_w[count])
+        self.send_data_bulk(self.lut_w[0:15])
         self.send_command(0x22) # bw r
-        for count in range(0, 15):
-            self.send_data(self.lut_b[count])
+        self.send_data_bulk(self.lut_b[0:15])
         self.send_command(0x23) # wb w
-        for count in range(0, 15):
-            self.send_data(self.lut_g1[count])
+        self.send_data_bulk(self.lut_g1[0:15])
         self.send_command(0x24) # bb b
-        for count in range(0, 15):
-            self.send_data(self.lut_g2[count])
+        self.send_data_bulk(self.lut_g2[0:15])
 
     def set_lut_red(self):
         self.send_command(0x25)
-        for count in range(0, 15):
-            self.send_data(self.lut_vcom1[count])
+        self.send_data_bulk(self.lut_vcom1[0:15])
         self.send_command(0x26)
-        for count in range(0, 15):
-            self.send_data(self.lut_red0[count])
+        self.send_data_bulk(self.lut_red0[0:15])
         self.send_command(0x27)
-        for count in range(0, 15):
-            self.send_data(self.lut_red1[count])
+        self.send_data_bulk(self.lut_red1[0:15])
             
     def init(self):
         if (epdconfig.module_init() != 0):
@@ -144,60 +141,50 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        buf = [0xFF] * int(self.width * self.height / 8)
-        # Set buffer to value of Python Imaging Library image.
-        # Image must be in mode 1.
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
+        # Image must be same dimensions as display
+        imwidth, imheight = image.size
         if imwidth != self.width or imheight != self.height:
             raise ValueError('Image must be same dimensions as display \
                 ({0}x{1}).' .format(self.width, self.height))
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
-        pixels = image_monocolor.load()
-        for y in range(self.height):
-            for x in range(self.width):
-                # Set the bits for the column of pixels at the current position.
-                if pixels[x, y] == 0:
-                    buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        return buf
+    def getbuffer_bicolor(self, image):
+        # Image must be same dimensions as display
+        imwidth, imheight = image.size
+        if imwidth != self.width or imheight != self.height:
+            raise ValueError('Image must be same dimensions as display \
+                ({0}x{1}).' .format(self.width, self.height))
+        # both planes of one color image in a single pass
+        return epdbuffer.getbuffer_bicolor(image, self.width, self.height)
 
     def display(self, blackimage, redimage):
+        if self.frame_digest.unchanged(blackimage, redimage):
+            return
         # send black data
         if (blackimage != None):
             self.send_command(0x10) # DATA_START_TRANSMISSION_1
-            for i in range(0, int(self.width * self.height / 8)):
-                temp = 0x00
-                for bit in range(0, 4):
-                    if (blackimage[i] & (0x80 >> bit) != 0):
-                        temp |= 0xC0 >> (bit * 2)
-                self.send_data(temp)  
-                temp = 0x00
-                for bit in range(4, 8):
-                    if (blackimage[i] & (0x80 >> bit) != 0):
-                        temp |= 0xC0 >> ((bit - 4) * 2)
-                self.send_data(temp)
+            # one bit per pixel becomes two
+            self.send_data_bulk(epdbuffer.double_bits(blackimage))
                 
         # send red data        
         if (redimage != None):
             self.send_command(0x13) # DATA_START_TRANSMISSION_2
-            for i in range(0, int(self.width * self.height / 8)):
-                self.send_data(redimage[i])  
+            self.send_data_bulk(redimage)
 
         self.send_command(0x12) # DISPLAY_REFRESH
         self.ReadBusy()
+        self.frame_digest.shown()
 
     def Clear(self):
         self.send_command(0x10) # DATA_START_TRANSMISSION_1
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
-            self.send_data(0xFF)
+        self.send_data_bulk([0xFF] * int(self.width * self.height / 4))
             
         self.send_command(0x13) # DATA_START_TRANSMISSION_2
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data_bulk([0xFF] * int(self.width * self.height / 8))
 
         self.send_command(0x12) # DISPLAY_REFRESH
         self.ReadBusy()
+        self.frame_digest.reset()
 
     def sleep(self):
         self.send_command(0x50) # VCOM_AND_DATA_INTERVAL_SETTING
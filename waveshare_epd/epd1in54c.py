@@ -28,6 +28,7 @@
 #
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 152
@@ -41,6 +42,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.frame_digest = epdbuffer.FrameDigest()
         
     # Hardware reset
     def reset(self):
@@ -62,11 +64,14 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a whole frame or LUT with DC/CS held once
+    def send_data_bulk(self, data):
+        epdconfig.send_data_bulk(data)
         
     def ReadBusy(self):
         logging.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      #  0: idle, 1: busy
-            epdconfig.delay_ms(200)                
+        epdconfig.wait_busy(0)      # 0: busy, 1: idle
         logging.debug("e-Paper busy release")
      
     def init(self):
@@ -96,50 +101,35 @@ class EPD:
         self.send_data(0x77)
 
     def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    #  Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
+
+    # black and color planes of one color image in a single pass
+    def getbuffer_bicolor(self, image):
+        return epdbuffer.getbuffer_bicolor(image, self.width, self.height)
 
     def display(self, blackimage, yellowimage):
+        if self.frame_digest.unchanged(blackimage, yellowimage):
+            return
         self.send_command(0x10)
         logging.debug("blackimage")
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(blackimage[i])
+        self.send_data_bulk(blackimage)
         self.send_command(0x13)
         logging.debug("yellowimage")
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(yellowimage[i])
+        self.send_data_bulk(yellowimage)
             
         self.send_command(0x12)
         self.ReadBusy()
+        self.frame_digest.shown()
         
     def Clear(self):
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)            
+        self.send_data_bulk([0xFF] * int(self.width * self.height / 8))
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data_bulk([0xFF] * int(self.width * self.height / 8))
             
         self.send_command(0x12)
         self.ReadBusy()
+        self.frame_digest.reset()
 
     #  after this, call epd.init() to awaken the module
     def sleep(self):
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 import numpy as np
 
 # Display resolution
@@ -44,6 +45,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.frame_digest = epdbuffer.FrameDigest()
         
     lut_full_update = [
         0x22, 0x55, 0xAA, 0x55, 0xAA, 0x55, 0xAA, 0x11,
@@ -79,10 +81,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a whole frame or LUT with DC/CS held once
+    def send_data_bulk(self, data):
+        epdconfig.send_data_bulk(data)
         
     def ReadBusy(self):        
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)            
+        epdconfig.wait_busy(1)      # 0: idle, 1: busy
 
     def TurnOnDisplay(self):
         self.send_command(0x22) # DISPLAY_UPDATE_CONTROL_2
@@ -126,8 +131,7 @@ class EPD:
         
         # WRITE_LUT_REGISTER
         self.send_command(0x32)
-        for count in range(30):
-            self.send_data(lut[count])
+        self.send_data_bulk(lut[0:30])
 
         return 0
         
@@ -155,50 +159,29 @@ class EPD:
         self.send_data(y & 0xFF)
         self.send_data((y >> 8) & 0xFF)
         self.ReadBusy()
-        
+
+    def WriteFrame(self, data):
+        # RAM address auto-increments (X then Y, see DATA_ENTRY_MODE_SETTING),
+        # so the whole window is streamed after a single cursor set
+        self.SetCursor(0, 0)
+        self.send_command(0x24) # WRITE_RAM
+        self.send_data_bulk(data)
+
     def getbuffer(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-         
-        buf = [0xFF] * (linewidth * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):                    
-                    if pixels[x, y] == 0:
-                        # x = imwidth - x
-                        buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        # newy = imwidth - newy - 1
-                        buf[int(newx / 8) + newy*linewidth] &= ~(0x80 >> (y % 8))
-        return buf   
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
         
     def display(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-
-        self.SetWindows(0, 0, self.width, self.height);
-        for j in range(0, self.height):
-            self.SetCursor(0, j);
-            self.send_command(0x24);
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])   
+        if self.frame_digest.unchanged(image):
+            return
+        self.SetWindows(0, 0, self.width - 1, self.height - 1)
+        self.WriteFrame(image)
         self.TurnOnDisplay()
+        # the controller flips between its two frame memories on every
+        # refresh, write the frame again so the next partial refresh
+        # starts from matching memories
+        self.WriteFrame(image)
+        self.frame_digest.shown()
     
     def Clear(self, color):
         if self.width%8 == 0:
@@ -206,13 +189,11 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
 
-        self.SetWindows(0, 0, self.width, self.height);
-        for j in range(0, self.height):
-            self.SetCursor(0, j);
-            self.send_command(0x24);
-            for i in range(0, linewidth):
-                self.send_data(color)   
+        self.SetWindows(0, 0, self.width - 1, self.height - 1)
+        self.WriteFrame([color] * (linewidth * self.height))
         self.TurnOnDisplay()
+        self.WriteFrame([color] * (linewidth * self.height))
+        self.frame_digest.reset()
 
     def sleep(self):
         self.send_command(0x10) #enter deep sleep
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 import numpy as np
 
 # Display resolution
@@ -44,6 +45,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.frame_digest = epdbuffer.FrameDigest()
         
     FULL_UPDATE = 0
     PART_UPDATE = 1
@@ -103,10 +105,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a whole frame or LUT with DC/CS held once
+    def send_data_bulk(self, data):
+        epdconfig.send_data_bulk(data)
         
     def ReadBusy(self):
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
+        epdconfig.wait_busy(1)      # 0: idle, 1: busy
 
     def TurnOnDisplay(self):
         self.send_command(0x22)
@@ -173,8 +178,7 @@ class EPD:
             self.send_data(self.lut_full_update[75])
 
             self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_full_update[count])
+            self.send_data_bulk(self.lut_full_update[0:70])
 
             self.send_command(0x4E)   # set RAM x address count to 0
             self.send_data(0x00)
@@ -189,8 +193,7 @@ class EPD:
             self.ReadBusy()
 
             self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_partial_update[count])
+            self.send_data_bulk(self.lut_partial_update[0:70])
 
             self.send_command(0x37)
             self.send_data(0x00)
@@ -211,57 +214,37 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-         
-        buf = [0xFF] * (linewidth * self.height)
+        linewidth = epdbuffer.linewidth(self.width)
         image_monocolor = image.convert('1')
         imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        
+        pixels = np.asarray(image_monocolor, dtype=bool)
+
         if(imwidth == self.width and imheight == self.height):
             logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):                    
-                    if pixels[x, y] == 0:
-                        x = imwidth - x
-                        buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
+            # mirrored, pixel x lands on bit (width - x) of the row
+            bits = np.ones((self.height, linewidth * 8), dtype=bool)
+            bits[:, 1:self.width + 1] = pixels[:, ::-1]
         elif(imwidth == self.height and imheight == self.width):
             logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        newy = imwidth - newy - 1
-                        buf[int(newx / 8) + newy*linewidth] &= ~(0x80 >> (y % 8))
-        return buf   
+            bits = pixels.T
+        else:
+            return b'\xff' * (linewidth * self.height)
+        return epdbuffer.pack_bits(bits, linewidth)
         
         
     def display(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-
+        if self.frame_digest.unchanged(image):
+            return
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])   
+        self.send_data_bulk(image)
         self.TurnOnDisplay()
+        self.frame_digest.shown()
         
     def displayPartial(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-
+        if self.frame_digest.unchanged(image):
+            return
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])   
+        self.send_data_bulk(image)
                 
                 
         # self.send_command(0x26)
@@ -269,24 +252,19 @@ class EPD:
             # for i in range(0, linewidth):
                 # self.send_data(~image[i + j * linewidth])  
         self.TurnOnDisplayPart()
+        self.frame_digest.shown()
 
     def displayPartBaseImage(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-
+        # always refreshes, but what the panel shows has to be known to display()
+        self.frame_digest.unchanged(image)
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])   
+        self.send_data_bulk(image)
                 
                 
         self.send_command(0x26)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])  
+        self.send_data_bulk(image)
         self.TurnOnDisplay()
+        self.frame_digest.shown()
     
     def Clear(self, color):
         if self.width%8 == 0:
@@ -296,10 +274,9 @@ class EPD:
         # logging.debug(linewidth)
         
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(color)   
+        self.send_data_bulk([color] * (linewidth * self.height))
         self.TurnOnDisplay()
+        self.frame_digest.reset()
 
     def sleep(self):
         self.send_command(0x10) #enter deep sleep
@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 104
@@ -42,6 +43,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.frame_digest = epdbuffer.FrameDigest()
 
     # Hardware reset
     def reset(self):
@@ -63,11 +65,14 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a whole frame or LUT with DC/CS held once
+    def send_data_bulk(self, data):
+        epdconfig.send_data_bulk(data)
         
     def ReadBusy(self):
         logging.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)
+        epdconfig.wait_busy(0)      # 0: busy, 1: idle
         logging.debug("e-Paper busy release")
 
     def init(self):
@@ -97,56 +102,39 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
+
+    # black and color planes of one color image in a single pass
+    def getbuffer_bicolor(self, image):
+        return epdbuffer.getbuffer_bicolor(image, self.width, self.height)
 
     def display(self, imageblack, imagered):
+        if self.frame_digest.unchanged(imageblack, imagered):
+            return
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(imageblack[i])
+        self.send_data_bulk(imageblack)
         self.send_command(0x92)
         
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(imagered[i])
+        self.send_data_bulk(imagered)
         self.send_command(0x92)
         
         self.send_command(0x12) # REFRESH
         self.ReadBusy()
+        self.frame_digest.shown()
         
     def Clear(self):
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data_bulk([0xFF] * int(self.width * self.height / 8))
         self.send_command(0x92) 
         
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data_bulk([0xFF] * int(self.width * self.height / 8))
         self.send_command(0x92)
         
         self.send_command(0x12) # REFRESH
         self.ReadBusy()
+        self.frame_digest.reset()
 
     def sleep(self):
         self.send_command(0x02) # POWER_OFF
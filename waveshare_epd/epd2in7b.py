@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 176
@@ -43,6 +44,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.frame_digest = epdbuffer.FrameDigest()
 
     lut_vcom_dc = [
         0x00, 0x00,
@@ -117,29 +119,27 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a whole frame or LUT with DC/CS held once
+    def send_data_bulk(self, data):
+        epdconfig.send_data_bulk(data)
         
     def ReadBusy(self):
         logging.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)
+        epdconfig.wait_busy(0)      # 0: busy, 1: idle
         logging.debug("e-Paper busy release")
         
     def set_lut(self):
         self.send_command(0x20)               # vcom
-        for count in range(0, 44):
-            self.send_data(self.lut_vcom_dc[count])
+        self.send_data_bulk(self.lut_vcom_dc[0:44])
         self.send_command(0x21)         # ww --
-        for count in range(0, 42):
-            self.send_data(self.lut_ww[count])
+        self.send_data_bulk(self.lut_ww[0:42])
         self.send_command(0x22)         # bw r
-        for count in range(0, 42):
-            self.send_data(self.lut_bw[count])
+        self.send_data_bulk(self.lut_bw[0:42])
         self.send_command(0x23)         # wb w
-        for count in range(0, 42):
-            self.send_data(self.lut_bb[count])
+        self.send_data_bulk(self.lut_bb[0:42])
         self.send_command(0x24)         # bb b
-        for count in range(0, 42):
-            self.send_data(self.lut_wb[count])
+        self.send_data_bulk(self.lut_wb[0:42])
             
     def init(self):
         if (epdconfig.module_init() != 0):
@@ -206,56 +206,39 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
+
+    # black and color planes of one color image in a single pass
+    def getbuffer_bicolor(self, image):
+        return epdbuffer.getbuffer_bicolor(image, self.width, self.height)
 
     def display(self, imageblack, imagered):
+        if self.frame_digest.unchanged(imageblack, imagered):
+            return
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(~imageblack[i])
+        self.send_data_bulk(epdbuffer.invert(imageblack))
         self.send_command(0x11)
         
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(~imagered[i])
+        self.send_data_bulk(epdbuffer.invert(imagered))
         self.send_command(0x11)
         
         self.send_command(0x12) 
         self.ReadBusy()
+        self.frame_digest.shown()
         
     def Clear(self):
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0x00)
+        self.send_data_bulk([0x00] * int(self.width * self.height / 8))
         self.send_command(0x11) 
         
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0x00)
+        self.send_data_bulk([0x00] * int(self.width * self.height / 8))
         self.send_command(0x11)
         
         self.send_command(0x12) 
         self.ReadBusy()
+        self.frame_digest.reset()
 
     def sleep(self):
         self.send_command(0X50)
@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 128
@@ -42,6 +43,13 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.frame_digest = epdbuffer.FrameDigest()
+        self.lut = None
+        # LUT display() refreshes with: the one given to init() or SetLut(),
+        # not the partial one displayPartial() switches to
+        self.display_lut = None
+        # last frame sent to the panel, displayPartial() diffs against it
+        self.frame = None
 
     lut_full_update = [
         0x50, 0xAA, 0x55, 0xAA, 0x11, 0x00,
@@ -79,10 +87,13 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a whole frame or LUT with DC/CS held once
+    def send_data_bulk(self, data):
+        epdconfig.send_data_bulk(data)
         
     def ReadBusy(self):
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  0: idle, 1: busy
-            epdconfig.delay_ms(200) 
+        epdconfig.wait_busy(1)      # 0: idle, 1: busy
 
     def TurnOnDisplay(self):
         self.send_command(0x22) # DISPLAY_UPDATE_CONTROL_2
@@ -113,7 +124,14 @@ class EPD:
         self.send_data(y & 0xFF)
         self.send_data((y >> 8) & 0xFF)
         self.ReadBusy()
-        
+
+    def WriteFrame(self, data, x = 0, y = 0):
+        # RAM address auto-increments (X then Y, see DATA_ENTRY_MODE_SETTING),
+        # so the whole window is streamed after a single cursor set
+        self.SetCursor(x, y)
+        self.send_command(0x24) # WRITE_RAM
+        self.send_data_bulk(data)
+
     def init(self, lut):
         if (epdconfig.module_init() != 0):
             return -1
@@ -142,55 +160,72 @@ class EPD:
         self.send_command(0x11) # DATA_ENTRY_MODE_SETTING
         self.send_data(0x03) # X increment Y increment
         
-        self.send_command(0x32) # WRITE_LUT_REGISTER
-        for i in range(0, len(lut)):
-            self.send_data(lut[i])
+        self.SetLut(lut)
         # EPD hardware init end
         return 0
 
+    def SetLut(self, lut):
+        self.send_command(0x32) # WRITE_LUT_REGISTER
+        self.send_data_bulk(lut)
+        self.lut = lut
+        self.display_lut = lut
+
     def getbuffer(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, image):
         if (image == None):
             return            
+        if self.frame_digest.unchanged(image):
+            return
+        if self.lut is not self.display_lut:
+            self.SetLut(self.display_lut)
         self.SetWindow(0, 0, self.width - 1, self.height - 1)
-        for j in range(0, self.height):
-            self.SetCursor(0, j)
-            self.send_command(0x24) # WRITE_RAM
-            for i in range(0, int(self.width / 8)):
-                self.send_data(image[i + j * int(self.width / 8)])   
+        self.WriteFrame(image)
+        self.TurnOnDisplay()
+        # the controller flips between its two frame memories on every
+        # refresh, write the frame again so displayPartial() starts from
+        # matching memories
+        self.WriteFrame(image)
+        self.frame = bytes(image)
+        self.frame_digest.shown()
+
+    def displayPartial(self, image):
+        # Only upload and refresh the rows and byte columns that changed since
+        # the last frame, using the partial update LUT
+        if (image == None):
+            return
+        if self.frame_digest.unchanged(image):
+            return
+        if self.frame is None:
+            self.display(image)
+            return
+        linewidth = int(self.width / 8)
+        window = epdbuffer.changed_window(self.frame, image, linewidth)
+        if window is None:
+            return
+        x_start, y_start, x_end, y_end = window
+        logging.debug("partial window x %d-%d y %d-%d", x_start * 8, x_end * 8 + 7, y_start, y_end)
+
+        if self.lut is not self.lut_partial_update:
+            display_lut = self.display_lut
+            self.SetLut(self.lut_partial_update)
+            self.display_lut = display_lut
+        data = epdbuffer.crop(image, linewidth, x_start, y_start, x_end, y_end)
+        self.SetWindow(x_start * 8, y_start, x_end * 8 + 7, y_end)
+        self.WriteFrame(data, x_start * 8, y_start)
         self.TurnOnDisplay()
+        self.WriteFrame(data, x_start * 8, y_start)
+        self.frame = bytes(image)
+        self.frame_digest.shown()
         
     def Clear(self, color):
         self.SetWindow(0, 0, self.width - 1, self.height - 1)
-        for j in range(0, self.height):
-            self.SetCursor(0, j)
-            self.send_command(0x24) # WRITE_RAM
-            for i in range(0, int(self.width / 8)):
-                self.send_data(color)   
+        self.WriteFrame([color] * (int(self.width / 8) * self.height))
         self.TurnOnDisplay()
+        self.WriteFrame([color] * (int(self.width / 8) * self.height))
+        self.frame = bytes([color]) * (int(self.width / 8) * self.height)
+        self.frame_digest.reset()
 
     def sleep(self):
         self.send_command(0x10) # DEEP_SLEEP_MODE
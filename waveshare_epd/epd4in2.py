@@ -28,10 +28,8 @@
 #
 
 
-import logging
 from . import epdconfig
-from PIL import Image
-import RPi.GPIO as GPIO
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 400
@@ -50,6 +48,7 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.frame_digest = epdbuffer.FrameDigest()
         self.GRAY1  = GRAY1 #white
         self.GRAY2  = GRAY2
         self.GRAY3  = GRAY3 #gray
@@ -173,58 +172,49 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a whole frame or LUT with DC/CS held once
+    def send_data_bulk(self, data):
+        epdconfig.send_data_bulk(data)
         
     def ReadBusy(self):
         self.send_command(0x71)
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            self.send_command(0x71)
-            epdconfig.delay_ms(100)    
+        epdconfig.wait_busy(0)      # 0: busy, 1: idle
 
     def set_lut(self):
         self.send_command(0x20)               # vcom
-        for count in range(0, 44):
-            self.send_data(self.lut_vcom0[count])
+        self.send_data_bulk(self.lut_vcom0[0:44])
             
         self.send_command(0x21)         # ww --
-        for count in range(0, 42):
-            self.send_data(self.lut_ww[count])
+        self.send_data_bulk(self.lut_ww[0:42])
             
         self.send_command(0x22)         # bw r
-        for count in range(0, 42):
-            self.send_data(self.lut_bw[count])
+        self.send_data_bulk(self.lut_bw[0:42])
             
         self.send_command(0x23)         # wb w
-        for count in range(0, 42):
-            self.send_data(self.lut_bb[count])
+        self.send_data_bulk(self.lut_bb[0:42])
             
         self.send_command(0x24)         # bb b
-        for count in range(0, 42):
-            self.send_data(self.lut_wb[count])
+        self.send_data_bulk(self.lut_wb[0:42])
         
     def Gray_SetLut(self):
         self.send_command(0x20)						#vcom
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_vcom[count]) 
+        self.send_data_bulk(self.EPD_4IN2_4Gray_lut_vcom[0:42])
 
         self.send_command(0x21)						#red not use
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_ww[count]) 
+        self.send_data_bulk(self.EPD_4IN2_4Gray_lut_ww[0:42])
 
         self.send_command(0x22)							#bw r
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_bw[count]) 
+        self.send_data_bulk(self.EPD_4IN2_4Gray_lut_bw[0:42])
 
         self.send_command(0x23)							#wb w
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_wb[count]) 
+        self.send_data_bulk(self.EPD_4IN2_4Gray_lut_wb[0:42])
 
         self.send_command(0x24)                          #bb b
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_bb[count]) 
+        self.send_data_bulk(self.EPD_4IN2_4Gray_lut_bb[0:42])
 
         self.send_command(0x25)						#vcom
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_ww[count])
+        self.send_data_bulk(self.EPD_4IN2_4Gray_lut_ww[0:42])
       
     
     def init(self):
@@ -310,161 +300,50 @@ class EPD:
         self.send_data(0x97)
 
     def getbuffer(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
         
     def getbuffer_4Gray(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = x
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
-        
-        return buf
+        return epdbuffer.getbuffer_4gray(image, self.width, self.height)
 
     def display(self, image):
+        if self.frame_digest.unchanged(image):
+            return
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data_bulk([0xFF] * int(self.width * self.height / 8))
             
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(image[i])
+        self.send_data_bulk(image)
             
         self.send_command(0x12) 
         self.ReadBusy()
+        self.frame_digest.shown()
     
     def display_4Gray(self, image):
+        if self.frame_digest.unchanged(image):
+            return
+        old, new = epdbuffer.split_4gray(image)
         self.send_command(0x10)
-        for i in range(0, EPD_WIDTH * EPD_HEIGHT / 8):                   # EPD_WIDTH * EPD_HEIGHT / 4
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x01#white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x00  #black
-                    elif(temp2 == 0x80): 
-                        temp3 |= 0x01  #gray1
-                    else: #0x40
-                        temp3 |= 0x00 #gray2
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):  #white
-                        temp3 |= 0x01
-                    elif(temp2 == 0x00): #black
-                        temp3 |= 0x00
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x01 #gray1
-                    else :   #0x40
-                            temp3 |= 0x00	#gray2	
-                    if(j!=1 or k!=1):				
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-            
-        self.send_command(0x13)	    
-               
-        for i in range(0, EPD_WIDTH * EPD_HEIGHT / 8):                #5808*4  46464
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x01#white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x00  #black
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00  #gray1
-                    else: #0x40
-                        temp3 |= 0x01 #gray2
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):  #white
-                        temp3 |= 0x01
-                    elif(temp2 == 0x00): #black
-                        temp3 |= 0x00
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00 #gray1
-                    else:    #0x40
-                            temp3 |= 0x01	#gray2
-                    if(j!=1 or k!=1):					
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
+        self.send_data_bulk(old)
+        self.send_command(0x13)
+        self.send_data_bulk(new)
         
         self.Gray_SetLut()
         self.send_command(0x12)
         epdconfig.delay_ms(200)
         self.ReadBusy()
+        self.frame_digest.shown()
         # pass
     
     def Clear(self):
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data_bulk([0xFF] * int(self.width * self.height / 8))
             
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data_bulk([0xFF] * int(self.width * self.height / 8))
             
         self.send_command(0x12) 
         self.ReadBusy()
+        self.frame_digest.reset()
 
     def sleep(self):
         self.send_command(0x02) # POWER_OFF
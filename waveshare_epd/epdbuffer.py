@@ -0,0 +1,277 @@
+# *****************************************************************************
+# * | File        :	  epdbuffer.py
+# * | Function    :   Frame buffer packing shared by the e-Paper drivers
+# * | Info        :
+# *----------------
+# * | Info        :   Converts PIL images into the byte layout the panels
+# * |             :   expect, using PIL's native 1-bit packing and NumPy
+# * |             :   instead of per-pixel Python loops.
+# ******************************************************************************
+
+import hashlib
+import logging
+
+import numpy as np
+
+
+def linewidth(width):
+    """Number of bytes per row for a 1-bit-per-pixel panel of this width."""
+    return (width + 7) // 8
+
+
+def panel_pixels(image, width, height, dtype=None):
+    """Return image as a (height, width, ...) array in panel orientation.
+
+    An image of the panel's size is used as is, one rotated by 90 degrees
+    ("Horizontal") is turned back into panel orientation. Returns None if the
+    image matches neither shape.
+    """
+    imwidth, imheight = image.size
+    if(imwidth == width and imheight == height):
+        logging.debug("Vertical")
+        return np.asarray(image, dtype=dtype)
+    elif(imwidth == height and imheight == width):
+        logging.debug("Horizontal")
+        # pixel (x, y) lands at panel column y, row height - x - 1
+        return np.rot90(np.asarray(image, dtype=dtype))
+    return None
+
+
+def monocolor_bits(image, width, height):
+    """Return image as a (height, width) bool array in panel orientation.
+
+    True is white. Returns None if the image does not fit the panel.
+    """
+    return panel_pixels(image.convert('1'), width, height, dtype=bool)
+
+
+def pack_bits(bits, bytes_per_row):
+    """Pack a (rows, columns) bool array MSB first into bytes_per_row per row.
+
+    Columns past the end of the array are padded with white (1) bits.
+    """
+    rows, columns = bits.shape
+    padding = bytes_per_row * 8 - columns
+    if padding:
+        bits = np.pad(bits, ((0, 0), (0, padding)), constant_values=True)
+    return np.packbits(bits, axis=1).tobytes()
+
+
+def changed_window(old, new, bytes_per_row):
+    """Smallest byte-aligned window holding every byte that differs.
+
+    Returns (x_start, y_start, x_end, y_end) in bytes and rows, inclusive, or
+    None if the frames are identical.
+    """
+    old_rows = np.frombuffer(bytes(old), dtype=np.uint8).reshape(-1, bytes_per_row)
+    new_rows = np.frombuffer(bytes(new), dtype=np.uint8).reshape(-1, bytes_per_row)
+    changed = old_rows != new_rows
+    rows = np.flatnonzero(changed.any(axis=1))
+    if len(rows) == 0:
+        return None
+    columns = np.flatnonzero(changed.any(axis=0))
+    return (int(columns[0]), int(rows[0]), int(columns[-1]), int(rows[-1]))
+
+
+def changed_fraction(old, new):
+    """Fraction of the bytes of two equally long frames that differ."""
+    old = np.frombuffer(bytes(old), dtype=np.uint8)
+    new = np.frombuffer(bytes(new), dtype=np.uint8)
+    return np.count_nonzero(old != new) / len(new)
+
+
+def crop(buf, bytes_per_row, x_start, y_start, x_end, y_end):
+    """Bytes of the inclusive window, row by row, as WRITE_RAM expects them."""
+    rows = np.frombuffer(bytes(buf), dtype=np.uint8).reshape(-1, bytes_per_row)
+    return rows[y_start:y_end + 1, x_start:x_end + 1].tobytes()
+
+
+def invert(buf):
+    """Bitwise NOT of every byte in buf, kept in the 0-255 range."""
+    return np.invert(np.frombuffer(bytes(buf), dtype=np.uint8)).tobytes()
+
+
+def _gray_code(level):
+    # the 4 gray drivers move 0xC0 and 0x80 down one step before keeping the
+    # top two bits
+    if level == 0xC0:
+        level = 0x80
+    elif level == 0x80:
+        level = 0x40
+    return level >> 6
+
+
+def _gray_bits(byte, shift):
+    # one bit per 2 bit gray code in byte, MSB first
+    bits = 0
+    for pixel in range(4):
+        bits = (bits << 1) | ((byte >> (6 - pixel * 2 + shift)) & 0x01)
+    return bits
+
+
+# 'L' level -> 2 bit gray code, 3 = white, 0 = black
+GRAY_CODE = np.array([_gray_code(level) for level in range(256)], dtype=np.uint8)
+# byte of four gray codes -> 4 bits for the 0x10 (high bit) and 0x13 (low bit) planes
+GRAY_HIGH_BITS = np.array([_gray_bits(byte, 1) for byte in range(256)], dtype=np.uint8)
+GRAY_LOW_BITS = np.array([_gray_bits(byte, 0) for byte in range(256)], dtype=np.uint8)
+
+
+def _uc8159_pixel(black, red):
+    # UC8159 4 bit pixel: red wins over black, anything else is white
+    if red == 0:
+        return 0x04
+    if black == 0:
+        return 0x00
+    return 0x03
+
+
+def _uc8159_2bpp(byte):
+    # four 2 bit codes -> two bytes of two UC8159 pixels; only 0b11 is white
+    # and only 0b00 is black, the mixed codes come out as 0x04
+    pixels = []
+    for shift in (6, 4, 2, 0):
+        code = (byte >> shift) & 0x03
+        pixels.append(0x03 if code == 0x03 else 0x00 if code == 0x00 else 0x04)
+    return [(pixels[0] << 4) | pixels[1], (pixels[2] << 4) | pixels[3]]
+
+
+def _uc8159_black_red(index):
+    # black nibble << 4 | red nibble -> two bytes of two UC8159 pixels
+    pixels = [_uc8159_pixel((index >> (7 - bit)) & 0x01, (index >> (3 - bit)) & 0x01)
+              for bit in range(4)]
+    return [(pixels[0] << 4) | pixels[1], (pixels[2] << 4) | pixels[3]]
+
+
+# 2 bpp byte -> 2 bytes of UC8159 pixels
+UC8159_2BPP = np.array([_uc8159_2bpp(byte) for byte in range(256)], dtype=np.uint8)
+# black nibble, red nibble -> 2 bytes of UC8159 pixels
+UC8159_BLACK_RED = np.array([_uc8159_black_red(index) for index in range(256)], dtype=np.uint8)
+
+
+def getbuffer(image, width, height):
+    """1 bit per pixel frame, rows padded to whole bytes, 1 = white."""
+    image_monocolor = image.convert('1')
+    if image_monocolor.size == (width, height) and width % 8 == 0:
+        logging.debug("Vertical")
+        # PIL's own '1' raw layout is exactly the panel layout
+        return image_monocolor.tobytes()
+
+    bits = monocolor_bits(image_monocolor, width, height)
+    if bits is None:
+        return b'\xff' * (linewidth(width) * height)
+    return pack_bits(bits, linewidth(width))
+
+
+def getbuffer_bicolor(image, width, height):
+    """Black and red (or yellow) 1 bit planes of one color image, 1 = white.
+
+    A pixel whose red channel is bright and blue channel dark goes to the
+    color plane, any other pixel goes to the black plane, black below half
+    brightness. Both planes are packed like getbuffer().
+    """
+    rgb = panel_pixels(image.convert('RGB'), width, height)
+    if rgb is None:
+        blank = b'\xff' * (linewidth(width) * height)
+        return blank, blank
+    color = (rgb[..., 0] >= 128) & (rgb[..., 2] < 128)
+    # ITU-R 601 luma, as PIL's 'L' conversion uses
+    luma = np.dot(rgb, (299, 587, 114)) // 1000
+    white = color | (luma >= 128)
+    bytes_per_row = linewidth(width)
+    return pack_bits(white, bytes_per_row), pack_bits(~color, bytes_per_row)
+
+
+def double_bits(buf):
+    """Repeat every bit of buf, turning a 1 bpp plane into a 2 bpp one."""
+    bits = np.unpackbits(np.frombuffer(bytes(buf), dtype=np.uint8))
+    return np.packbits(np.repeat(bits, 2)).tobytes()
+
+
+def getbuffer_2bpp(image, width, height):
+    """2 bits per pixel frame for the UC8159 panels, 0b11 = white, 0b00 = black."""
+    bits = monocolor_bits(image, width, height)
+    if bits is None:
+        return bytes(width * height // 4)
+    return np.packbits(np.repeat(bits, 2, axis=1), axis=1).tobytes()
+
+
+def getbuffer_4gray(image, width, height):
+    """2 bits per pixel gray frame, 0b11 = white, 0b00 = black."""
+    image_gray = image.convert('L')
+    imwidth, imheight = image_gray.size
+    if(imwidth == width and imheight == height):
+        logging.debug("Vertical")
+        levels = np.asarray(image_gray)
+    elif(imwidth == height and imheight == width):
+        logging.debug("Horizontal")
+        # pixel (x, y) lands at panel column y, row x
+        levels = np.asarray(image_gray).T
+    else:
+        return b'\xff' * (width // 4 * height)
+    codes = GRAY_CODE[levels]
+    packed = (codes[:, 0::4] << 6) | (codes[:, 1::4] << 4) | (codes[:, 2::4] << 2) | codes[:, 3::4]
+    return packed.tobytes()
+
+
+def split_4gray(buf):
+    """Split a getbuffer_4gray() frame into the 0x10 and 0x13 bit planes."""
+    pairs = np.frombuffer(bytes(buf), dtype=np.uint8).reshape(-1, 2)
+    high = (GRAY_HIGH_BITS[pairs[:, 0]] << 4) | GRAY_HIGH_BITS[pairs[:, 1]]
+    low = (GRAY_LOW_BITS[pairs[:, 0]] << 4) | GRAY_LOW_BITS[pairs[:, 1]]
+    return high.tobytes(), low.tobytes()
+
+
+def expand_2bpp(buf):
+    """UC8159 4 bit per pixel frame from a getbuffer_2bpp() frame."""
+    return UC8159_2BPP[np.frombuffer(bytes(buf), dtype=np.uint8)].tobytes()
+
+
+def expand_black_red(black, red):
+    """UC8159 4 bit per pixel frame from a black and a red 1 bit plane.
+
+    A 0 bit in red gives red, otherwise a 0 bit in black gives black.
+    """
+    black = np.frombuffer(bytes(black), dtype=np.uint8)
+    red = np.frombuffer(bytes(red), dtype=np.uint8)
+    out = np.empty((len(black), 4), dtype=np.uint8)
+    # the high and low nibbles of each byte pair are four pixels each
+    out[:, 0:2] = UC8159_BLACK_RED[(black & 0xF0) | (red >> 4)]
+    out[:, 2:4] = UC8159_BLACK_RED[((black & 0x0F) << 4) | (red & 0x0F)]
+    return out.tobytes()
+
+
+class FrameDigest:
+    """Digest of the frame a panel is showing, so repeats can be skipped.
+
+    A driver calls unchanged() with the planes it is about to send and returns
+    early if it is True, then calls shown() once the refresh went through.
+    skipped counts the refreshes saved.
+    """
+
+    def __init__(self):
+        self.digest = None
+        self.pending = None
+        self.skipped = 0
+
+    def unchanged(self, *planes):
+        digest = hashlib.blake2b(digest_size=16)
+        for plane in planes:
+            # length prefix keeps the planes apart, a missing one is all ones
+            if plane is None:
+                digest.update(b'\xff' * 4)
+                continue
+            data = bytes(plane)
+            digest.update(len(data).to_bytes(4, 'little'))
+            digest.update(data)
+        self.pending = digest.digest()
+        if self.pending == self.digest:
+            self.skipped += 1
+            logging.debug("frame unchanged, refresh skipped (%d so far)", self.skipped)
+            return True
+        return False
+
+    def shown(self):
+        self.digest = self.pending
+
+    def reset(self):
+        self.digest = None
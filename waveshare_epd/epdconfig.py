@@ -32,6 +32,14 @@ import logging
 import sys
 import time
 
+# How long wait_busy() sleeps on the edge before looking at the pin again, in
+# case the edge came between reading the pin and arming the edge detection
+BUSY_RECHECK_MS = 100
+
+
+class BusyTimeoutError(RuntimeError):
+    pass
+
 
 class RaspberryPi:
     # Pin definition
@@ -40,6 +48,9 @@ class RaspberryPi:
     CS_PIN          = 8
     BUSY_PIN        = 24
 
+    # Longest refresh wait_busy() allows before giving up, in ms
+    BUSY_TIMEOUT_MS = 60000
+
     def __init__(self):
         import spidev
         import RPi.GPIO
@@ -58,9 +69,31 @@ class RaspberryPi:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy(self, level, timeout=None):
+        # Sleep on a BUSY pin edge while it reads level, instead of polling
+        if timeout is None:
+            timeout = self.BUSY_TIMEOUT_MS
+        edge = self.GPIO.FALLING if level else self.GPIO.RISING
+        deadline = time.monotonic() + timeout / 1000.0
+        while self.GPIO.input(self.BUSY_PIN) == level:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                raise BusyTimeoutError('e-Paper still busy after %d ms' % timeout)
+            self.GPIO.wait_for_edge(self.BUSY_PIN, edge, timeout=min(remaining_ms, BUSY_RECHECK_MS))
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
+    def spi_writebyte2(self, data):
+        # writebytes2 takes any buffer and splits it into spidev bufsiz chunks
+        self.SPI.writebytes2(data)
+
+    def send_data_bulk(self, data):
+        self.digital_write(self.DC_PIN, 1)
+        self.digital_write(self.CS_PIN, 0)
+        self.spi_writebyte2(data)
+        self.digital_write(self.CS_PIN, 1)
+
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
@@ -90,6 +123,9 @@ class JetsonNano:
     CS_PIN          = 8
     BUSY_PIN        = 24
 
+    # Longest refresh wait_busy() allows before giving up, in ms
+    BUSY_TIMEOUT_MS = 60000
+
     def __init__(self):
         import ctypes
         find_dirs = [
@@ -118,9 +154,31 @@ class JetsonNano:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy(self, level, timeout=None):
+        # Sleep on a BUSY pin edge while it reads level, instead of polling
+        if timeout is None:
+            timeout = self.BUSY_TIMEOUT_MS
+        edge = self.GPIO.FALLING if level else self.GPIO.RISING
+        deadline = time.monotonic() + timeout / 1000.0
+        while self.GPIO.input(self.BUSY_PIN) == level:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                raise BusyTimeoutError('e-Paper still busy after %d ms' % timeout)
+            self.GPIO.wait_for_edge(self.BUSY_PIN, edge, timeout=min(remaining_ms, BUSY_RECHECK_MS))
+
     def spi_writebyte(self, data):
         self.SPI.SYSFS_software_spi_transfer(data[0])
 
+    def spi_writebyte2(self, data):
+        for byte in bytes(data):
+            self.SPI.SYSFS_software_spi_transfer(byte)
+
+    def send_data_bulk(self, data):
+        self.digital_write(self.DC_PIN, 1)
+        self.digital_write(self.CS_PIN, 0)
+        self.spi_writebyte2(data)
+        self.digital_write(self.CS_PIN, 1)
+
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
@@ -142,13 +200,48 @@ class JetsonNano:
         self.GPIO.cleanup()
 
 
-if os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
-    implementation = RaspberryPi()
-else:
-    implementation = JetsonNano()
-
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
+def backend_class():
+    # EPD_BACKEND=sim runs the drivers against epdsim.Simulated, no panel needed
+    backend = os.environ.get('EPD_BACKEND', '')
+    if backend == 'sim':
+        from .epdsim import Simulated
+        return Simulated
+    if backend == 'rpi':
+        return RaspberryPi
+    if backend == 'jetson':
+        return JetsonNano
+    if os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
+        return RaspberryPi
+    return JetsonNano
+
+
+# Created on first use rather than at import, so importing a driver does not
+# open the SPI device or load the GPIO library
+implementation = None
+
+
+def use(backend):
+    """Send every epdconfig call to backend, e.g. an epdsim.Simulated()."""
+    global implementation
+    implementation = backend
+    for func in [x for x in dir(implementation) if not x.startswith('_')]:
+        setattr(sys.modules[__name__], func, getattr(implementation, func))
+    return implementation
+
+
+def __getattr__(name):
+    if name.startswith('_'):
+        raise AttributeError(name)
+    backend = backend_class()
+    # pin numbers and timeouts are known without touching the hardware
+    if implementation is None and name.isupper() and hasattr(backend, name):
+        return getattr(backend, name)
+    if implementation is None:
+        use(backend())
+    try:
+        return getattr(implementation, name)
+    except AttributeError:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 ### END OF FILE ###
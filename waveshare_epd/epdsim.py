@@ -0,0 +1,315 @@
+# *****************************************************************************
+# * | File        :	  epdsim.py
+# * | Function    :   Simulated e-Paper backend for epdconfig
+# * | Info        :
+# *----------------
+# * | Info        :   Stands in for RaspberryPi / JetsonNano when no panel is
+# * |             :   attached. Records the bus and GPIO traffic, holds BUSY
+# * |             :   for the panel's refresh time and decodes the frame
+# * |             :   memory back into an image.
+# * |             :
+# * |             :   Selected with EPD_BACKEND=sim, configured with
+# * |             :     EPD_SIM_PANEL       panel name, default 2in9
+# * |             :     EPD_SIM_REFRESH_MS  refresh time, default per panel
+# * |             :     EPD_SIM_SPEED       divide every sleep by this
+# * |             :     EPD_SIM_PNG         save each refresh here, "{n}" in
+# * |             :                         the name is the refresh count
+# ******************************************************************************
+
+import logging
+import os
+import time
+
+from . import epdbuffer
+from . import panel as registry_panel
+
+SPI_HZ = 4000000
+
+SSD = 'ssd'     # SSD16xx: windowed RAM at 0x24 / 0x26, refresh on 0x20
+UC = 'uc'       # UC81xx / IL0xxx: streamed planes at 0x10 / 0x13, refresh on 0x12
+
+# panel: (full refresh ms, controller, black plane command, format, bit value
+# that is white, color plane command, bit value that is colored)
+# format '1' is 1 bit per pixel, '2' 2 bits (top bit counts), '4' is the
+# UC8159 4 bit pixel with 0 black, 3 white and 4 red
+PANEL_FRAMES = {
+    '1in02':     (1500,  UC,  0x13, '1', 1, None, None),
+    '1in54':     (2000,  SSD, 0x24, '1', 1, None, None),
+    '1in54_V2':  (2000,  SSD, 0x24, '1', 1, None, None),
+    '1in54b':    (8000,  UC,  0x10, '2', 1, 0x13, 0),
+    '1in54c':    (15000, UC,  0x10, '1', 1, 0x13, 0),
+    '2in13':     (2000,  SSD, 0x24, '1', 1, None, None),
+    '2in13_V2':  (2000,  SSD, 0x24, '1', 1, None, None),
+    '2in13bc':   (15000, UC,  0x10, '1', 1, 0x13, 0),
+    '2in13d':    (2000,  UC,  0x13, '1', 1, None, None),
+    '2in7':      (6000,  UC,  0x13, '1', 1, None, None),
+    '2in7b':     (15000, UC,  0x10, '1', 0, 0x13, 1),
+    '2in9':      (2000,  SSD, 0x24, '1', 1, None, None),
+    '2in9bc':    (15000, UC,  0x10, '1', 1, 0x13, 0),
+    '2in9d':     (2000,  UC,  0x13, '1', 1, None, None),
+    '4in2':      (4000,  UC,  0x13, '1', 1, None, None),
+    '4in2bc':    (15000, UC,  0x10, '1', 1, 0x13, 0),
+    '5in83':     (6000,  UC,  0x10, '4', 1, None, None),
+    '5in83bc':   (16000, UC,  0x10, '4', 1, None, None),
+    '7in5':      (6000,  UC,  0x10, '4', 1, None, None),
+    '7in5_V2':   (5000,  UC,  0x13, '1', 0, None, None),
+    '7in5bc':    (16000, UC,  0x10, '4', 1, None, None),
+    '7in5bc_V2': (16000, UC,  0x10, '1', 1, 0x13, 1),
+}
+
+# panels whose getbuffer() mirrors each row, with the padding bits in front
+MIRRORED_PANELS = {'2in13_V2': 1}
+
+# UC8151 panels whose partial mode flips the data polarity through VCOM and
+# data interval (0x50): with DDX[0] (bit 4) clear, as SetPartReg() leaves
+# it, the 0x13 plane holds the inverted frame
+CDI_POLARITY_PANELS = {'2in9d', '2in13d'}
+CDI_DDX0 = 0x10
+
+
+class Simulated:
+    # Pin definition, same as the hardware backends
+    RST_PIN         = 17
+    DC_PIN          = 25
+    CS_PIN          = 8
+    BUSY_PIN        = 24
+
+    # Longest refresh wait_busy() allows before giving up, in ms
+    BUSY_TIMEOUT_MS = 60000
+
+    def __init__(self, panel=None, refresh_ms=None, speed=None, png=None):
+        self.panel = registry_panel(panel or os.environ.get('EPD_SIM_PANEL', '2in9'))
+        (default_ms, self.controller, self.black_plane, self.black_format, self.white_bit,
+         self.color_plane, self.color_bit) = PANEL_FRAMES[self.panel.name]
+        if refresh_ms is None:
+            refresh_ms = float(os.environ.get('EPD_SIM_REFRESH_MS', default_ms))
+        self.refresh_ms = refresh_ms
+        self.speed = speed or float(os.environ.get('EPD_SIM_SPEED', 1))
+        self.png = png or os.environ.get('EPD_SIM_PNG')
+        # BUSY reads 1 while busy on the SSD parts and 0 on the UC parts
+        self.busy_level = 1 if self.controller == SSD else 0
+        self.busy_until = 0
+        self.bytes_per_row = epdbuffer.linewidth(self.panel.width)
+
+        self.pins = {}
+        self.dc = 0
+        self.command = None
+        self.args = bytearray()
+        self.ram = {}
+        self.offset = {}
+        self.shown = None
+        # SSD RAM addressing, see 0x11, 0x44, 0x45, 0x4E and 0x4F
+        self.entry_mode = 0x03
+        self.x_start, self.x_end = 0, self.bytes_per_row - 1
+        self.y_start, self.y_end = 0, self.panel.height - 1
+        self.x, self.y = 0, 0
+        self.cdi = CDI_DDX0
+        self.reset_counters()
+
+    def reset_counters(self):
+        """Clear the traffic log and counters, keeping the frame memory."""
+        self.bus = []           # (dc, bytes) per transfer
+        self.gpio = []          # (time, pin, value) per digital_write
+        self.commands = 0
+        self.data_bytes = 0
+        self.refreshes = 0
+        self.busy_waits = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def bus_seconds(self):
+        """Time the traffic so far takes on an SPI_HZ bus."""
+        return (self.commands + self.data_bytes) * 8.0 / SPI_HZ
+
+    def digital_write(self, pin, value):
+        self.gpio.append((time.monotonic(), pin, value))
+        self.pins[pin] = value
+        if pin == self.DC_PIN:
+            self.dc = value
+
+    def digital_read(self, pin):
+        if pin == self.BUSY_PIN:
+            busy = time.monotonic() < self.busy_until
+            return self.busy_level if busy else 1 - self.busy_level
+        return self.pins.get(pin, 0)
+
+    def delay_ms(self, delaytime):
+        time.sleep(delaytime / 1000.0 / self.speed)
+
+    def wait_busy(self, level, timeout=None):
+        if timeout is None:
+            timeout = self.BUSY_TIMEOUT_MS
+        self.busy_waits += 1
+        remaining = self.busy_until - time.monotonic()
+        if remaining <= 0:
+            return
+        if remaining * 1000 > timeout:
+            from .epdconfig import BusyTimeoutError
+            raise BusyTimeoutError('e-Paper still busy after %d ms' % timeout)
+        time.sleep(remaining)
+        self.busy_seconds += remaining
+
+    def spi_writebyte(self, data):
+        self.transfer(bytes(data))
+
+    def spi_writebyte2(self, data):
+        self.transfer(bytes(data))
+
+    def send_data_bulk(self, data):
+        self.digital_write(self.DC_PIN, 1)
+        self.digital_write(self.CS_PIN, 0)
+        self.spi_writebyte2(data)
+        self.digital_write(self.CS_PIN, 1)
+
+    def module_init(self):
+        return 0
+
+    def module_exit(self):
+        logging.debug("simulated panel, %d refreshes", self.refreshes)
+
+    def transfer(self, data):
+        self.bus.append((self.dc, data))
+        if self.dc:
+            self.data_bytes += len(data)
+            self.data(data)
+            return
+        self.commands += len(data)
+        for command in data:
+            self.start_command(command)
+
+    def start_command(self, command):
+        self.command = command
+        self.args = bytearray()
+        self.offset[command] = 0
+        if command == (0x20 if self.controller == SSD else 0x12):
+            self.refresh()
+
+    def data(self, data):
+        command = self.command
+        if self.controller == SSD:
+            if command in (0x24, 0x26):
+                self.write_window(self.plane(command, self.bytes_per_row * self.panel.height), data)
+                return
+            self.args += data
+            self.address(command, self.args)
+        elif command in (0x10, 0x13):
+            plane = self.ram.setdefault(command, bytearray())
+            offset = self.offset[command]
+            plane[offset:offset + len(data)] = data
+            self.offset[command] = offset + len(data)
+        elif command == 0x50:
+            self.args += data
+            if len(self.args) == 1:
+                self.cdi = self.args[0]
+
+    def plane(self, command, size):
+        if command not in self.ram:
+            self.ram[command] = bytearray(b'\xff' * size)
+        return self.ram[command]
+
+    def address(self, command, args):
+        if command == 0x11 and len(args) == 1:
+            self.entry_mode = args[0]
+        elif command == 0x44 and len(args) == 2:
+            self.x_start, self.x_end = args[0], args[1]
+        elif command == 0x45 and len(args) == 4:
+            self.y_start = args[0] | args[1] << 8
+            self.y_end = args[2] | args[3] << 8
+        elif command == 0x4E and len(args) == 1:
+            self.x = args[0]
+        elif command == 0x4F and len(args) == 2:
+            self.y = args[0] | args[1] << 8
+
+    def write_window(self, plane, data):
+        # bytes fill the window row by row in the 0x11 entry direction
+        x_step = 1 if self.entry_mode & 0x01 else -1
+        y_step = 1 if self.entry_mode & 0x02 else -1
+        pos = 0
+        while pos < len(data):
+            count = min((self.x_end - self.x) * x_step + 1, len(data) - pos)
+            if count < 1:
+                count = 1
+            chunk = data[pos:pos + count]
+            if 0 <= self.y < self.panel.height:
+                row = self.y * self.bytes_per_row
+                if x_step > 0:
+                    first = self.x
+                else:
+                    first, chunk = self.x - count + 1, chunk[::-1]
+                if first >= 0 and first + count <= self.bytes_per_row:
+                    plane[row + first:row + first + count] = chunk
+            pos += count
+            self.x += count * x_step
+            if (self.x - self.x_end) * x_step > 0:
+                self.x = self.x_start
+                self.y += y_step
+                if (self.y - self.y_end) * y_step > 0:
+                    self.y = self.y_start
+
+    def refresh(self):
+        self.refreshes += 1
+        self.busy_until = time.monotonic() + self.refresh_ms / 1000.0 / self.speed
+        inverted = self.panel.name in CDI_POLARITY_PANELS and not self.cdi & CDI_DDX0
+        self.shown = ({command: bytes(plane) for command, plane in self.ram.items()}, self.entry_mode, inverted)
+        if self.png:
+            self.save_png(self.png.format(n=self.refreshes))
+
+    def image(self):
+        """RGB image of what the panel shows since the last refresh."""
+        import numpy as np
+        from PIL import Image
+
+        width, height = self.panel.width, self.panel.height
+        pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+        if self.shown is None:
+            return Image.fromarray(pixels)
+        planes, entry_mode, inverted = self.shown
+
+        black = self.decode(planes.get(self.black_plane), self.black_format)
+        if black is not None and inverted:
+            black = 1 - black
+        if black is not None:
+            if self.black_format == '4':
+                pixels[black == 0x00] = (0, 0, 0)
+                pixels[black == 0x04] = (255, 0, 0)
+            else:
+                pixels[black != self.white_bit] = (0, 0, 0)
+        color = self.decode(planes.get(self.color_plane), '1')
+        if color is not None:
+            pixels[color == self.color_bit] = (255, 0, 0)
+
+        if self.controller == SSD:
+            # undo the RAM address direction so the frame reads as it was sent
+            if not entry_mode & 0x02:
+                pixels = pixels[::-1]
+            if not entry_mode & 0x01:
+                pixels = pixels[:, ::-1]
+        return Image.fromarray(np.ascontiguousarray(pixels))
+
+    def decode(self, plane, format):
+        # (height, width) array of bits or 4 bit pixels, None if never written
+        import numpy as np
+
+        if plane is None:
+            return None
+        width, height = self.panel.width, self.panel.height
+        if format == '4':
+            size = width // 2 * height
+        elif format == '2':
+            size = width // 4 * height
+        else:
+            size = self.bytes_per_row * height
+        raw = np.frombuffer(plane[:size].ljust(size, b'\xff'), dtype=np.uint8).reshape(height, -1)
+        if format == '4':
+            return np.stack((raw >> 4, raw & 0x0F), axis=-1).reshape(height, -1)[:, :width]
+        bits = np.unpackbits(raw, axis=1)
+        if format == '2':
+            bits = bits[:, 0::2]
+        if self.panel.name in MIRRORED_PANELS:
+            padding = MIRRORED_PANELS[self.panel.name]
+            return bits[:, padding:padding + width][:, ::-1]
+        return bits[:, :width]
+
+    def save_png(self, path):
+        self.image().save(path)
+        logging.debug("saved simulated frame %d to %s", self.refreshes, path)